@@ -0,0 +1,250 @@
+# Copyright (c) 2021-present, Jonxslays
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the
+#    distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Reports resident memory per 1k guilds for each cache profile.
+
+Synthetic guilds are fed through hikari's event manager the same way
+gateway events are, each profile measured in a fresh process.
+
+    PYTHONPATH=. python scripts/cache_memory.py [guilds] [messages]
+"""
+
+from __future__ import annotations
+
+import asyncio
+import gc
+import subprocess
+import sys
+import typing as t
+
+import hikari
+
+from starr.bus import BusShard
+from starr.cache import CACHE_PROFILES
+
+JOINED = "2021-01-01T00:00:00+00:00"
+
+
+def rss_kib() -> int:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+
+    raise RuntimeError("Couldn't read VmRSS, this only works on linux.")
+
+
+def user(user_id: int) -> dict[str, t.Any]:
+    return {"id": str(user_id), "username": f"u{user_id}", "discriminator": "0001", "avatar": None}
+
+
+def guild(guild_id: int) -> dict[str, t.Any]:
+    # Roughly a mid sized guild, as sent without the members intent.
+    base = guild_id * 1_000
+    return {
+        "id": str(guild_id),
+        "name": f"guild {guild_id}",
+        "owner_id": "1",
+        "unavailable": False,
+        "large": False,
+        "member_count": 500,
+        "joined_at": JOINED,
+        "channels": [
+            {
+                "id": str(base + i),
+                "type": 0,
+                "guild_id": str(guild_id),
+                "name": f"channel-{i}",
+                "position": i,
+                "permission_overwrites": [],
+                "nsfw": False,
+                "parent_id": None,
+                "topic": "A topic for this channel.",
+                "last_message_id": None,
+                "rate_limit_per_user": 0,
+            }
+            for i in range(40)
+        ],
+        "roles": [
+            {
+                "id": str(guild_id if i == 0 else base + 100 + i),
+                "name": f"role {i}",
+                "color": i,
+                "hoist": False,
+                "position": i,
+                "permissions": "0",
+                "managed": False,
+                "mentionable": False,
+                "icon": None,
+                "unicode_emoji": None,
+            }
+            for i in range(25)
+        ],
+        "emojis": [
+            {
+                "id": str(base + 200 + i),
+                "name": f"emoji{i}",
+                "roles": [],
+                "require_colons": True,
+                "managed": False,
+                "animated": False,
+                "available": True,
+            }
+            for i in range(50)
+        ],
+        "members": [
+            {
+                "user": user(base + 300 + i),
+                "roles": [],
+                "joined_at": JOINED,
+                "deaf": False,
+                "mute": False,
+            }
+            for i in range(10)
+        ],
+        "presences": [],
+        "voice_states": [],
+        "threads": [],
+        "stickers": [],
+        "features": [],
+        "afk_timeout": 0,
+        "verification_level": 0,
+        "default_message_notifications": 0,
+        "explicit_content_filter": 0,
+        "mfa_level": 0,
+        "system_channel_flags": 0,
+        "premium_tier": 0,
+        "nsfw_level": 0,
+        "preferred_locale": "en-US",
+        "premium_progress_bar_enabled": False,
+        "icon": None,
+        "splash": None,
+        "discovery_splash": None,
+        "banner": None,
+        "description": None,
+        "afk_channel_id": None,
+        "application_id": None,
+        "system_channel_id": None,
+        "rules_channel_id": None,
+        "public_updates_channel_id": None,
+        "vanity_url_code": None,
+        "max_video_channel_users": 25,
+        "max_members": 500_000,
+        "widget_enabled": False,
+        "widget_channel_id": None,
+        "premium_subscription_count": 0,
+    }
+
+
+def message(guild_id: int, message_id: int) -> dict[str, t.Any]:
+    author = user(guild_id * 1_000 + 300)
+    return {
+        "id": str(message_id),
+        "channel_id": str(guild_id * 1_000),
+        "guild_id": str(guild_id),
+        "author": author,
+        "member": {"roles": [], "joined_at": JOINED, "deaf": False, "mute": False},
+        "content": "Some message content that is long enough to be realistic.",
+        "timestamp": JOINED,
+        "edited_timestamp": None,
+        "tts": False,
+        "mention_everyone": False,
+        "mentions": [],
+        "mention_roles": [],
+        "attachments": [],
+        "embeds": [],
+        "pinned": False,
+        "type": 0,
+        "flags": 0,
+    }
+
+
+async def feed(profile: str, guilds: int, messages: int) -> int:
+    bot = hikari.GatewayBot(
+        "token",
+        banner=None,
+        cache_settings=hikari.impl.CacheSettings(components=CACHE_PROFILES[profile]),
+    )
+    shard = BusShard(
+        http_settings=bot.http_settings,
+        proxy_settings=bot.proxy_settings,
+        event_manager=bot.event_manager,
+        event_factory=bot.event_factory,
+        intents=bot.intents,
+        token="token",
+        url="",
+    )
+    shard.user_id = hikari.Snowflake(1)
+
+    gc.collect()
+    before = rss_kib()
+
+    for guild_id in range(1, guilds + 1):
+        bot.event_manager.consume_raw_event("GUILD_CREATE", shard, guild(guild_id))
+
+        for i in range(messages):
+            payload = message(guild_id, guild_id * 1_000 + 500 + i)
+            bot.event_manager.consume_raw_event("MESSAGE_CREATE", shard, payload)
+
+        if guild_id % 100 == 0:
+            # Let the dispatch tasks run, so they don't pile up.
+            while len(asyncio.all_tasks()) > 1:
+                await asyncio.sleep(0)
+
+    while len(asyncio.all_tasks()) > 1:
+        await asyncio.sleep(0)
+
+    gc.collect()
+    assert len(bot.cache.get_guilds_view()) in (0, guilds)
+    return rss_kib() - before
+
+
+def main() -> None:
+    guilds = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000
+    messages = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    print(f"{guilds} guilds, {messages} messages each")
+
+    for profile in CACHE_PROFILES:
+        out = subprocess.run(
+            [sys.executable, __file__, "--child", profile, str(guilds), str(messages)],
+            capture_output=True,
+            check=True,
+            text=True,
+        )
+        kib = int(out.stdout)
+        print(f"{profile:>8}: {kib / 1024:8.1f} MiB, {kib / guilds:8.1f} MiB per 1k guilds")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--child"]:
+        print(asyncio.run(feed(sys.argv[2], int(sys.argv[3]), int(sys.argv[4]))))
+    else:
+        main()
@@ -0,0 +1,150 @@
+# Copyright (c) 2021-present, Jonxslays
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the
+#    distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Fires a burst of star reactions at one message and checks that it
+is posted to the starboard exactly once.
+
+REST and the database are stood in for with fakes that take a little
+time to answer, so the handlers really do interleave.
+
+    PYTHONPATH=. python scripts/star_race.py [reactions]
+"""
+
+from __future__ import annotations
+
+import asyncio
+import datetime
+import sys
+import types
+import typing as t
+
+# Imported first to settle the bot import cycle.
+from starr import utils  # noqa: F401
+from starr.models import StarboardMessage
+from starr.models import StarrGuild
+from starr.modules import stars
+
+GUILD_ID = 1
+CHANNEL_ID = 2
+STAR_CHANNEL_ID = 3
+# Older than startup, so the database is asked about it.
+MESSAGE_ID = 4
+
+
+class FakeRest:
+    def __init__(self) -> None:
+        self.created = 0
+        self.edits = 0
+
+    async def fetch_message(self, channel_id: int, message_id: int) -> t.Any:
+        await asyncio.sleep(0.001)
+        return types.SimpleNamespace(
+            id=message_id,
+            channel_id=channel_id,
+            content="A message worth starring.",
+            timestamp=datetime.datetime.now(datetime.timezone.utc),
+            author=types.SimpleNamespace(
+                username="someone",
+                discriminator="0001",
+                avatar_url=None,
+                default_avatar_url="https://cdn.discordapp.com/embed/avatars/0.png",
+            ),
+            attachments=[],
+            embeds=[],
+            make_link=lambda guild_id: f"https://discord.com/channels/{guild_id}/1/2",
+        )
+
+    async def create_message(self, **_: t.Any) -> t.Any:
+        await asyncio.sleep(0.01)
+        self.created += 1
+        return types.SimpleNamespace(id=1_000 + self.created)
+
+    async def edit_message(self, *_: t.Any) -> None:
+        await asyncio.sleep(0.001)
+        self.edits += 1
+
+
+class FakeDatabase:
+    def __init__(self) -> None:
+        self.starboard: dict[int, int] = {}
+
+    async def fetch_one(self, q: str, reference_id: int) -> int | None:
+        await asyncio.sleep(0.002)
+        return self.starboard.get(reference_id)
+
+    async def execute(self, q: str, star_message_id: int, reference_id: int, *_: t.Any) -> None:
+        await asyncio.sleep(0.002)
+        self.starboard.setdefault(reference_id, star_message_id)
+
+
+class FakeChannels:
+    async def get(self, channel_id: int) -> str:
+        return "general"
+
+
+async def main(reactions: int) -> None:
+    rest, db = FakeRest(), FakeDatabase()
+    fake_bot = types.SimpleNamespace(rest=rest, db=db, channel_names=FakeChannels())
+    stars.stars._app = fake_bot  # type: ignore[assignment]
+
+    created = 0
+    create_new = StarboardMessage.create_new
+
+    async def counted(*args: t.Any) -> t.Any:
+        nonlocal created
+        created += 1
+        return await create_new(*args)
+
+    StarboardMessage.create_new = counted  # type: ignore[assignment]
+
+    guild = StarrGuild(GUILD_ID, "./", STAR_CHANNEL_ID, 1, [])
+    event = types.SimpleNamespace(
+        guild_id=GUILD_ID,
+        channel_id=CHANNEL_ID,
+        message_id=MESSAGE_ID,
+        emoji_name=stars.stars.d.star,
+    )
+    await asyncio.gather(
+        *(
+            stars.handle_star_added(event, guild, n)  # type: ignore[arg-type]
+            for n in range(1, reactions + 1)
+        )
+    )
+    await stars.stars.d.edits.close()
+
+    print(f"{reactions} reactions: {created} created, {rest.edits} edits")
+    assert created == 1, f"expected one starboard post, got {created}"
+    assert rest.created == 1, f"expected one message sent, got {rest.created}"
+    assert len(stars.stars.d.locks) == 0, f"{len(stars.stars.d.locks)} locks left behind"
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 500))
@@ -0,0 +1,123 @@
+# Copyright (c) 2021-present, Jonxslays
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the
+#    distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Reports tag resolution latency as the tags table grows.
+
+Tags and aliases are spread over 1k guilds in a scratch schema, and
+random names and aliases are resolved through `use_tag` after each
+batch is added. The latency should stay flat however many tags other
+guilds have. Needs the usual PG_* variables, and drops the schema
+when it's done.
+
+    PYTHONPATH=. python scripts/tag_resolve.py [tags] [guilds]
+"""
+
+from __future__ import annotations
+
+import asyncio
+import random
+import statistics
+import sys
+import time
+
+import asyncpg
+from dotenv import load_dotenv  # pyright: ignore
+
+from starr.db import Database
+from starr.queries import QUERIES
+
+SCHEMA = "starr_bench"
+
+
+async def seed(conn: asyncpg.Connection, start: int, stop: int, guilds: int) -> None:
+    # Every tag gets an alias, in the guild it belongs to.
+    tags = [(i % guilds, i, f"tag{i}", "Some tag content.") for i in range(start, stop)]
+    await conn.copy_records_to_table(
+        "tags", records=tags, columns=("guildid", "tagowner", "tagname", "tagcontent")
+    )
+    await conn.copy_records_to_table(
+        "tag_aliases",
+        records=[(g, name, f"alias{i}") for g, i, name, _ in tags],
+        columns=("guildid", "tagname", "tagalias"),
+    )
+    await conn.execute("ANALYZE tags; ANALYZE tag_aliases;")
+
+
+async def measure(conn: asyncpg.Connection, total: int, guilds: int, runs: int) -> list[float]:
+    query = await conn.prepare(QUERIES["tag_use"])
+    timings = []
+
+    for _ in range(runs):
+        i = random.randrange(total)
+        name = f"tag{i}" if random.random() < 0.5 else f"alias{i}"
+
+        start = time.perf_counter()
+        assert await query.fetchrow(i % guilds, name)
+        timings.append(time.perf_counter() - start)
+
+    return timings
+
+
+async def main(tags: int, guilds: int) -> None:
+    db = Database()
+    conn: asyncpg.Connection = await asyncpg.connect(
+        user=db.user,
+        host=db.host,
+        port=db.port,
+        database=db.db,
+        password=db.password,
+        server_settings={"search_path": SCHEMA},
+    )
+
+    try:
+        await conn.execute(f"CREATE SCHEMA {SCHEMA};")
+        await db.migrate(conn)
+        print(f"{'tags':>8} {'p50':>9} {'p99':>9}")
+        seeded = 0
+
+        for size in (tags // 100, tags // 10, tags):
+            await seed(conn, seeded, size, guilds)
+            seeded = size
+            timings = sorted(await measure(conn, seeded, guilds, 2_000))
+            p50 = statistics.median(timings) * 1_000_000
+            p99 = timings[int(len(timings) * 0.99)] * 1_000_000
+            print(f"{seeded:>8,} {p50:>7.0f}us {p99:>7.0f}us")
+
+    finally:
+        await conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;")
+        await conn.close()
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    tags = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    guilds = int(sys.argv[2]) if len(sys.argv) > 2 else 1_000
+    asyncio.run(main(tags, guilds))
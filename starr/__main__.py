@@ -31,21 +31,10 @@
 
 from __future__ import annotations
 
-import hikari
 from dotenv import load_dotenv  # pyright: ignore
 
-from starr import utils
-from starr.bot import StarrBot
+from starr import launcher
 
-load_dotenv()
-
-bot = StarrBot()
-utils.configure_logging()
-
-bot.run(
-    status=hikari.Status.IDLE,
-    activity=hikari.Activity(
-        name="the stars!",
-        type=hikari.ActivityType.WATCHING,
-    ),
-)
+if __name__ == "__main__":
+    load_dotenv()
+    launcher.launch()
@@ -31,15 +31,37 @@
 
 from __future__ import annotations
 
+import asyncio
+import logging
+import time
+import typing as t
 from os import environ
 
 import aiohttp
 import hikari
 import lightbulb
 
+from starr import metrics
 from starr import utils
+from starr.cache import CACHE_PROFILES
+from starr.cache import ChannelNames
+from starr.concurrency import LoopMonitor
 from starr.db import Database
+from starr.models import GuildBootstrap
+from starr.models import StarboardMessage
 from starr.models import StarrGuild
+from starr.models import TagIndex
+from starr.models import TagUses
+from starr.snapshot import GuildSnapshot
+
+_log = logging.getLogger(__name__)
+
+INTENTS = (
+    hikari.Intents.GUILDS
+    | hikari.Intents.GUILD_MESSAGE_REACTIONS
+    | hikari.Intents.GUILD_MESSAGES
+    | hikari.Intents.MESSAGE_CONTENT
+)
 
 
 class StarrBot(lightbulb.BotApp):
@@ -52,55 +74,236 @@ class StarrBot(lightbulb.BotApp):
         "client",
         "my_id",
         "session",
+        "tag_uses",
+        "tag_index",
+        "channel_names",
+        "bootstrap",
+        "started_at",
+        "ready_after",
+        "_awaiting",
+        "_tasks",
+        "snapshot",
+        "shard_ids",
+        "total_shards",
+        "bus_slot",
+        "loop_monitor",
+        "metrics",
     )
 
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        shard_ids: t.Sequence[int] | None = None,
+        shard_count: int | None = None,
+        bus_slot: tuple[int, int] | None = None,
+    ) -> None:
         super().__init__(
             token=environ["TOKEN"],
-            intents=hikari.Intents.GUILDS
-            | hikari.Intents.GUILD_MESSAGE_REACTIONS
-            | hikari.Intents.GUILD_MESSAGES
-            | hikari.Intents.MESSAGE_CONTENT,
+            intents=INTENTS,
+            cache_settings=hikari.impl.CacheSettings(
+                components=CACHE_PROFILES[environ.get("CACHE_PROFILE") or "trimmed"]
+            ),
             prefix=lightbulb.when_mentioned_or(self.resolve_prefix),
             case_insensitive_prefix_commands=True,
             owner_ids=(452940863052578816,),
             default_enabled_guilds=utils.get_command_guilds(),
         )
 
+        # Set when this process only runs some of the shards.
+        self.shard_ids = shard_ids
+        self.total_shards = shard_count
+        # The slot and number of slots, when taking events from the
+        # bus, only the slot's guilds are ours.
+        self.bus_slot = bus_slot
         self.db = Database()
         self.check(lightbulb.guild_only)
         self.guilds: dict[int, StarrGuild] = {}
+        self.tag_uses = TagUses(self.db)
+        self.tag_index = TagIndex(self.db, self.tag_uses)
+        self.channel_names = ChannelNames(self.cache, self.rest)
+        self.bootstrap = GuildBootstrap(self.db)
+        self.loop_monitor = LoopMonitor()
+        self.snapshot = GuildSnapshot(
+            shard=min(shard_ids) if shard_ids else bus_slot[0] if bus_slot else None
+        )
+        # Guilds discord said it will send us, once they have all
+        # arrived the bot is ready.
+        self._awaiting: set[int] = set()
+        # The loop only keeps weak references to tasks.
+        self._tasks: set[asyncio.Task[None]] = set()
+        self.started_at = 0.0
+        self.ready_after: float | None = None
+        self.metrics = metrics.MetricsServer()
+        metrics.instrument_rest()
+        self.register_metrics()
 
         self.subscribe(hikari.StartingEvent, self.on_starting)
         self.subscribe(hikari.StartedEvent, self.on_started)
         self.subscribe(hikari.StoppedEvent, self.on_stopped)
+        self.subscribe(hikari.ShardReadyEvent, self.on_shard_ready)
         self.subscribe(hikari.GuildAvailableEvent, self.on_guild_available)
         self.subscribe(hikari.GuildJoinEvent, self.on_guild_available)
+        self.subscribe(hikari.GuildChannelUpdateEvent, self.on_channel_changed)
+        self.subscribe(hikari.GuildChannelDeleteEvent, self.on_channel_changed)
+        # One handler for every stateless paginator's buttons.
+        self.subscribe(hikari.InteractionCreateEvent, utils.Paginator.on_interaction)
 
     async def on_starting(self, _: hikari.StartingEvent) -> None:
+        self.started_at = time.perf_counter()
+        self.loop_monitor.start()
+        await self.metrics.start()
+        # Serve from the last snapshot until the database catches up.
+        snapshot = {k: v for k, v in self.snapshot.load().items() if self.owns_guild(k)}
+        self.guilds.update(snapshot)
+        _log.info("Loaded %s guilds from the snapshot", len(snapshot))
+
         await self.db.connect()
         self.session = aiohttp.ClientSession()
+        self.tag_uses.start()
+        self.snapshot.start(self.guilds)
+        task = asyncio.create_task(self.reconcile_guilds(snapshot))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
         self.load_extensions_from("./starr/modules")
+        metrics.count_events(self, utils.Plugin.events)
 
     async def on_started(self, _: hikari.StartedEvent) -> None:
-        if data := await self.db.fetch_rows("SELECT * FROM guilds;"):
-            for guild in data:
-                obj = StarrGuild(*guild)
-                self.guilds[obj.guild_id] = obj
-
         self.my_id = (self.get_me() or await self.rest.fetch_my_user()).id
 
     async def on_stopped(self, _: hikari.StoppingEvent) -> None:
+        self.loop_monitor.close()
+        await self.metrics.close()
+        await self.tag_uses.close()
+        await self.snapshot.close(self.guilds)
         await self.db.close()
         await self.session.close()
 
+    def register_metrics(self) -> None:
+        def cache_requests() -> list[metrics.Sample]:
+            refs = StarboardMessage.references
+            return [
+                (
+                    "",
+                    {"cache": "channel_names", "result": "hikari"},
+                    self.channel_names.hikari_hits,
+                ),
+                ("", {"cache": "channel_names", "result": "hit"}, self.channel_names.hits),
+                ("", {"cache": "channel_names", "result": "miss"}, self.channel_names.misses),
+                ("", {"cache": "starboard_references", "result": "hit"}, refs.hits),
+                ("", {"cache": "starboard_references", "result": "miss"}, refs.misses),
+                ("", {"cache": "tag_index", "result": "hit"}, self.tag_index.hits),
+                ("", {"cache": "tag_index", "result": "miss"}, self.tag_index.misses),
+            ]
+
+        def loop_lag() -> t.Iterator[metrics.Sample]:
+            lag = self.loop_monitor
+            return metrics.histogram_samples({}, lag.BUCKETS, lag.buckets, lag.total)
+
+        def pool() -> list[metrics.Sample]:
+            if not (p := getattr(self.db, "pool", None)):
+                return []
+
+            idle = p.get_idle_size()
+            return [("", {"state": "idle"}, idle), ("", {"state": "busy"}, p.get_size() - idle)]
+
+        def dropped_logs() -> list[metrics.Sample]:
+            handlers = logging.getLogger("root").handlers
+            dropped = [h.dropped for h in handlers if isinstance(h, utils.BoundedQueueHandler)]
+            return [("", {}, sum(dropped))]
+
+        r = metrics.registry
+        r.collector(
+            "starr_cache_requests_total", "Cache lookups by result.", "counter", cache_requests
+        )
+        r.collector("starr_loop_lag_seconds", "Event loop lag.", "histogram", loop_lag)
+        r.collector(
+            "starr_loop_stalls_total",
+            "Times the event loop was blocked.",
+            "counter",
+            lambda: [("", {}, self.loop_monitor.stalls)],
+        )
+        r.collector("starr_db_pool_connections", "Pooled connections.", "gauge", pool)
+        r.collector(
+            "starr_db_statement_hits_total",
+            "Uses of each named statement.",
+            "counter",
+            lambda: [("", {"statement": n}, hits) for n, hits in self.db.statements.report()],
+        )
+        r.collector(
+            "starr_log_records_dropped_total", "Log records dropped.", "counter", dropped_logs
+        )
+        r.collector(
+            "starr_guilds", "Guilds configured.", "gauge", lambda: [("", {}, len(self.guilds))]
+        )
+        r.collector(
+            "starr_ready_seconds",
+            "Time from starting until every guild arrived.",
+            "gauge",
+            lambda: [("", {}, self.ready_after)] if self.ready_after else [],
+        )
+
+    async def reconcile_guilds(self, snapshot: dict[int, StarrGuild]) -> None:
+        """Replace guilds loaded from the snapshot with the database's
+        copy, leaving any that were loaded or changed since alone."""
+        if self.bus_slot:
+            rows = self.db.stream("guild_select_slot", self.bus_slot[1], self.bus_slot[0])
+
+        elif self.shard_ids and self.total_shards:
+            rows = self.db.stream("guild_select_shards", self.total_shards, self.shard_ids)
+
+        else:
+            rows = self.db.stream("SELECT * FROM guilds;")
+
+        async for guild in rows:
+            obj = StarrGuild(*guild)
+            current = self.guilds.get(obj.guild_id)
+
+            # A row read before a command changed the guild would undo
+            # the change.
+            if current is snapshot.get(obj.guild_id) and not (current and current.changed):
+                self.guilds[obj.guild_id] = obj
+
+        _log.info("Reconciled %s guilds with the database", len(self.guilds))
+
+    def owns_guild(self, guild_id: int) -> bool:
+        """Whether this guild belongs to one of our shards, or our
+        slot on the bus."""
+        if self.bus_slot:
+            slot, slots = self.bus_slot
+            return guild_id % slots == slot
+
+        if not self.shard_ids or not self.total_shards:
+            return True
+
+        return (guild_id >> 22) % self.total_shards in self.shard_ids
+
     async def on_guild_available(
         self, event: hikari.GuildAvailableEvent | hikari.GuildJoinEvent
     ) -> None:
+        if not self.owns_guild(event.guild_id):
+            # Every bus worker sees every guild arrive.
+            return None
+
         if event.guild_id not in self.guilds:
-            guild = await StarrGuild.default_with_insert(self.db, event.guild_id)
+            # Guilds arrive in a burst on startup, the bootstrap
+            # loads them in batches instead of one at a time.
+            guild = await self.bootstrap.get(event.guild_id)
             self.guilds[guild.guild_id] = guild
 
+        if event.guild_id in self._awaiting:
+            self._awaiting.discard(event.guild_id)
+
+            if not self._awaiting:
+                self.ready_after = time.perf_counter() - self.started_at
+                _log.info("Ready with %s guilds after %.2fs", len(self.guilds), self.ready_after)
+
+    async def on_shard_ready(self, event: hikari.ShardReadyEvent) -> None:
+        self._awaiting.update(g for g in event.unavailable_guilds if self.owns_guild(g))
+
+    async def on_channel_changed(
+        self, event: hikari.GuildChannelUpdateEvent | hikari.GuildChannelDeleteEvent
+    ) -> None:
+        self.channel_names.invalidate(event.channel_id)
+
     async def resolve_prefix(self, _: lightbulb.BotApp, message: hikari.Message) -> tuple[str]:
         assert message.guild_id is not None
 
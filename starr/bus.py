@@ -0,0 +1,318 @@
+# Copyright (c) 2021-present, Jonxslays
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the
+#    distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from __future__ import annotations
+
+import asyncio
+import collections
+import contextlib
+import logging
+import marshal
+import os
+import struct
+import typing as t
+from os import environ
+
+import hikari
+
+_log = logging.getLogger(__name__)
+
+# Every frame is its length, followed by the marshalled event name,
+# shard id, shard count and raw payload. Workers send their slot in
+# the same format when they connect.
+_LENGTH = struct.Struct(">I")
+
+Frame = tuple[str, int, int, dict[str, t.Any]]
+
+
+def encode(name: str, shard_id: int, shard_count: int, payload: dict[str, t.Any]) -> bytes:
+    # Payloads are decoded json, so they only hold types marshal
+    # understands.
+    data = marshal.dumps((name, shard_id, shard_count, payload))
+    return _LENGTH.pack(len(data)) + data
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Frame:
+    (length,) = _LENGTH.unpack(await reader.readexactly(_LENGTH.size))
+    frame: Frame = marshal.loads(await reader.readexactly(length))
+    return frame
+
+
+class BusState:
+    """The raw events a worker's cache is built from, so a worker that
+    connects late can be brought up to date without the gateway
+    reconnecting.
+
+    Each guild keeps its create event and the changes since then, a
+    guild that changes more than `max_changes` times loses its oldest
+    changes.
+    """
+
+    __slots__ = ("_ready", "_guilds", "_max_changes")
+
+    def __init__(self, max_changes: int = 500) -> None:
+        self._ready: dict[int, bytes] = {}
+        self._guilds: dict[int, tuple[bytes, collections.deque[bytes]]] = {}
+        self._max_changes = max_changes
+
+    def __len__(self) -> int:
+        return len(self._guilds)
+
+    def remember(self, name: str, shard_id: int, guild_id: int, frame: bytes) -> None:
+        if name == "READY":
+            self._ready[shard_id] = frame
+
+        elif name == "GUILD_CREATE":
+            self._guilds[guild_id] = (frame, collections.deque(maxlen=self._max_changes))
+
+        elif name == "GUILD_DELETE":
+            self._guilds.pop(guild_id, None)
+
+        elif guild := self._guilds.get(guild_id):
+            guild[1].append(frame)
+
+    def replay(self, slot: int, slots: int) -> list[bytes]:
+        """Every shard's ready, and the state of the slot's guilds."""
+        frames = [*self._ready.values()]
+
+        for guild_id, (create, changes) in self._guilds.items():
+            if guild_id % slots != slot:
+                continue
+
+            frames.append(create)
+            frames.extend(changes)
+
+        return frames
+
+
+class BusServer:
+    """The gateway's end of the bus, which hands events out to the
+    connected workers.
+
+    Each worker takes one of `slots` fixed slots, and every guild
+    belongs to one slot for as long as the gateway runs. Frames for a
+    slot whose worker is down wait in its queue until it is back.
+    """
+
+    __slots__ = ("_path", "_server", "_slots", "_connected", "state", "dropped")
+
+    def __init__(
+        self, path: str | None = None, slots: int | None = None, maxsize: int = 10_000
+    ) -> None:
+        self._path = path or environ.get("BUS_PATH") or "./starr/data/bus.sock"
+        self._server: asyncio.AbstractServer | None = None
+        slots = slots or int(environ.get("WORKERS") or 1)
+        self._slots: list[asyncio.Queue[bytes]] = [asyncio.Queue(maxsize) for _ in range(slots)]
+        self._connected: set[int] = set()
+        self.state = BusState()
+        self.dropped = 0
+
+    @property
+    def workers(self) -> int:
+        return len(self._connected)
+
+    async def start(self) -> None:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(self._path)
+
+        self._server = await asyncio.start_unix_server(self._on_connect, self._path)
+
+    async def close(self) -> None:
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    def publish(self, key: int, frame: bytes, *, buffer: bool = True) -> None:
+        """Send a frame to the slot that owns `key`. Without `buffer`
+        it is only sent if the slot's worker is connected."""
+        slot = key % len(self._slots)
+
+        if not buffer and slot not in self._connected:
+            return None
+
+        try:
+            self._slots[slot].put_nowait(frame)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    def broadcast(self, frame: bytes) -> None:
+        # Only to connected workers, the replay brings the others up
+        # to date when they connect.
+        for slot in self._connected:
+            try:
+                self._slots[slot].put_nowait(frame)
+            except asyncio.QueueFull:
+                self.dropped += 1
+
+    async def _on_connect(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            # The only thing a worker ever sends is its slot.
+            (slot,) = _LENGTH.unpack(await reader.readexactly(_LENGTH.size))
+        except asyncio.IncompleteReadError:
+            writer.close()
+            return None
+
+        if slot >= len(self._slots) or slot in self._connected:
+            _log.warning("Refused a worker for slot %s, it is taken or doesn't exist", slot)
+            writer.close()
+            return None
+
+        queue = self._slots[slot]
+        # Nothing can be published between taking the replay and
+        # marking the slot connected, so the worker misses nothing.
+        replay = self.state.replay(slot, len(self._slots))
+        self._connected.add(slot)
+        _log.info(
+            "Worker %s connected, replaying %s frames with %s waiting",
+            slot,
+            len(replay),
+            queue.qsize(),
+        )
+        sender = asyncio.create_task(self._send(writer, queue, replay))
+
+        try:
+            # This only returns once the worker is gone.
+            await reader.read()
+        finally:
+            sender.cancel()
+            self._connected.discard(slot)
+            writer.close()
+            _log.info("Worker %s disconnected, %s left", slot, len(self._connected))
+
+    async def _send(
+        self, writer: asyncio.StreamWriter, queue: asyncio.Queue[bytes], replay: list[bytes]
+    ) -> None:
+        with contextlib.suppress(ConnectionError):
+            writer.writelines(replay)
+            await writer.drain()
+
+            while True:
+                writer.write(await queue.get())
+
+                if queue.empty():
+                    await writer.drain()
+
+
+class BusShard(hikari.impl.GatewayShardImpl):
+    """Stands in for one of the gateway's shards, so events have a
+    shard to belong to. It never connects itself."""
+
+    __slots__ = ("user_id",)
+
+    def __init__(self, *args: t.Any, **kwargs: t.Any) -> None:
+        super().__init__(*args, **kwargs)
+        # Set from the shard's ready event.
+        self.user_id: hikari.Snowflake | None = None
+
+    def get_user_id(self) -> hikari.Snowflake:
+        if self.user_id is None:
+            raise hikari.ComponentStateConflictError("This shard hasn't been readied yet.")
+
+        return self.user_id
+
+
+class BusClient:
+    """A worker's end of the bus, which feeds the gateway's events into
+    the bot as if they came from its own shards."""
+
+    __slots__ = ("_path", "_bot", "_slot", "_shards", "_task")
+
+    def __init__(self, bot: hikari.GatewayBot, slot: int, path: str | None = None) -> None:
+        self._path = path or environ.get("BUS_PATH") or "./starr/data/bus.sock"
+        self._bot = bot
+        self._slot = slot
+        self._shards: dict[int, BusShard] = {}
+        self._task: asyncio.Task[None] | None = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def _shard(self, shard_id: int, shard_count: int) -> BusShard:
+        if not (shard := self._shards.get(shard_id)):
+            shard = BusShard(
+                http_settings=self._bot.http_settings,
+                proxy_settings=self._bot.proxy_settings,
+                event_manager=self._bot.event_manager,
+                event_factory=self._bot.event_factory,
+                intents=self._bot.intents,
+                token=environ["TOKEN"],
+                url="",
+                shard_id=shard_id,
+                shard_count=shard_count,
+            )
+            self._shards[shard_id] = shard
+
+        return shard
+
+    async def _run(self) -> None:
+        backoff = 1.0
+
+        while True:
+            try:
+                reader, writer = await asyncio.open_unix_connection(self._path)
+
+            except (ConnectionError, FileNotFoundError):
+                _log.warning("Bus isn't up yet, retrying in %ss", backoff)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+                continue
+
+            writer.write(_LENGTH.pack(self._slot))
+            _log.info("Connected to the bus at %s as slot %s", self._path, self._slot)
+            backoff = 1.0
+
+            try:
+                while True:
+                    name, shard_id, shard_count, payload = await read_frame(reader)
+                    shard = self._shard(shard_id, shard_count)
+
+                    if name == "READY":
+                        shard.user_id = hikari.Snowflake(payload["user"]["id"])
+
+                    self._bot.event_manager.consume_raw_event(name, shard, payload)
+
+            except (ConnectionError, asyncio.IncompleteReadError):
+                _log.warning("Lost the bus connection, reconnecting")
+
+            finally:
+                writer.close()
+
+            # The gateway may not have noticed the old connection for
+            # this slot is gone yet.
+            await asyncio.sleep(1)
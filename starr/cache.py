@@ -0,0 +1,260 @@
+# Copyright (c) 2021-present, Jonxslays
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the
+#    distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from __future__ import annotations
+
+import collections
+import datetime
+import time
+import typing as t
+
+import hikari
+
+K = t.TypeVar("K")
+V = t.TypeVar("V")
+T = t.TypeVar("T")
+
+# Which of hikari's caches to keep, chosen with CACHE_PROFILE. The
+# trimmed profile only keeps what the plugins read. Roles are there
+# for userinfo, and threads for naming starboard channels.
+CACHE_PROFILES: dict[str, hikari.api.CacheComponents] = {
+    "trimmed": hikari.api.CacheComponents.GUILDS
+    | hikari.api.CacheComponents.GUILD_CHANNELS
+    | hikari.api.CacheComponents.GUILD_THREADS
+    | hikari.api.CacheComponents.ROLES
+    | hikari.api.CacheComponents.ME,
+    "default": hikari.api.CacheComponents.ALL,
+}
+
+
+class LRUCache(t.Generic[K, V]):
+    """A bounded cache that evicts the least recently used keys, and
+    optionally expires keys after a time to live."""
+
+    __slots__ = ("_maxsize", "_ttl", "_data", "hits", "misses")
+
+    def __init__(self, maxsize: int, ttl: float | None = None) -> None:
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._data: collections.OrderedDict[K, tuple[float, V]] = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __setitem__(self, key: K, value: V) -> None:
+        expires = time.monotonic() + self._ttl if self._ttl is not None else float("inf")
+        self._data[key] = (expires, value)
+        self._data.move_to_end(key)
+
+        while len(self._data) > self._maxsize:
+            self._data.popitem(last=False)
+
+    def __getitem__(self, key: K) -> V:
+        if (item := self._data.get(key)) is None:
+            self.misses += 1
+            raise KeyError(key)
+
+        if item[0] <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            raise KeyError(key)
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return item[1]
+
+    @t.overload
+    def get(self, key: K) -> V | None:
+        ...
+
+    @t.overload
+    def get(self, key: K, default: T) -> V | T:
+        ...
+
+    def get(self, key: K, default: t.Any = None) -> t.Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def pop(self, key: K) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+
+class StarCount:
+    __slots__ = ("count", "synced_at", "events")
+
+    def __init__(self, count: int) -> None:
+        self.count = count
+        self.synced_at = time.monotonic()
+        self.events = 0
+
+
+class StarCounts:
+    """Star counts for messages, seeded from the api the first time a
+    message is seen and kept up to date from reaction events after.
+
+    Counts are synced from the api again once they have seen too many
+    events, or gotten too old, to correct any drift from missed events.
+    """
+
+    __slots__ = ("_counts", "_resync_events", "_resync_after")
+
+    def __init__(
+        self, maxsize: int = 10_000, resync_events: int = 50, resync_after: float = 600
+    ) -> None:
+        self._counts: LRUCache[int, StarCount] = LRUCache(maxsize)
+        self._resync_events = resync_events
+        self._resync_after = resync_after
+
+    def add(self, message_id: int, delta: int) -> int | None:
+        """Apply a change to a message's count, returning the new count
+        or None if the message needs to be synced."""
+        if not (star_count := self._counts.get(message_id)):
+            return None
+
+        if (
+            star_count.events >= self._resync_events
+            or time.monotonic() - star_count.synced_at >= self._resync_after
+        ):
+            self._counts.pop(message_id)
+            return None
+
+        star_count.events += 1
+        star_count.count = max(star_count.count + delta, 0)
+        return star_count.count
+
+    def sync(self, message_id: int, count: int) -> int:
+        self._counts[message_id] = StarCount(count)
+        return count
+
+    def forget(self, message_id: int) -> None:
+        self._counts.pop(message_id)
+
+
+class StarboardReferences:
+    """Which messages are on the starboard, and which are not.
+
+    Every starboard entry made since startup is recorded here, so a
+    message newer than that which isn't recorded can't be on the
+    starboard, and never needs to be looked up. Older messages are
+    looked up once, and the result cached for a while.
+    """
+
+    __slots__ = ("_stars", "_maxsize", "_absent", "_complete_after", "hits", "misses")
+
+    def __init__(self, maxsize: int = 50_000, ttl: float = 3600) -> None:
+        self._stars: collections.OrderedDict[int, int] = collections.OrderedDict()
+        self._maxsize = maxsize
+        self._absent: LRUCache[int, bool] = LRUCache(maxsize, ttl)
+        self._complete_after = int(
+            hikari.Snowflake.from_datetime(datetime.datetime.now(datetime.timezone.utc))
+        )
+        self.hits = 0
+        self.misses = 0
+
+    def __getitem__(self, reference_id: int) -> int | None:
+        """Get the starboard message id for a message, None if it isn't
+        on the starboard, or raise KeyError if we don't know."""
+        if (star_message_id := self._stars.get(reference_id)) is not None:
+            self._stars.move_to_end(reference_id)
+            self.hits += 1
+            return star_message_id
+
+        if reference_id > self._complete_after or self._absent.get(reference_id):
+            self.hits += 1
+            return None
+
+        self.misses += 1
+        raise KeyError(reference_id)
+
+    def __setitem__(self, reference_id: int, star_message_id: int | None) -> None:
+        if star_message_id is None:
+            self._stars.pop(reference_id, None)
+            self._absent[reference_id] = True
+            return None
+
+        self._absent.pop(reference_id)
+        self._stars[reference_id] = star_message_id
+        self._stars.move_to_end(reference_id)
+
+        while len(self._stars) > self._maxsize:
+            evicted, _ = self._stars.popitem(last=False)
+            # We can't vouch for messages this old anymore.
+            self._complete_after = max(self._complete_after, evicted)
+
+
+class ChannelNames:
+    """Resolves channel names from hikari's cache, then our own, and
+    only falls back to the api when neither has the channel."""
+
+    __slots__ = ("_cache", "_rest", "_names", "hikari_hits", "hits", "misses")
+
+    def __init__(
+        self,
+        cache: hikari.api.Cache,
+        rest: hikari.api.RESTClient,
+        maxsize: int = 5_000,
+        ttl: float = 3600,
+    ) -> None:
+        self._cache = cache
+        self._rest = rest
+        self._names: LRUCache[int, str] = LRUCache(maxsize, ttl)
+        self.hikari_hits = 0
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, channel_id: int) -> str | None:
+        cached = self._cache.get_guild_channel(channel_id) or self._cache.get_thread(channel_id)
+
+        if cached:
+            self.hikari_hits += 1
+            return cached.name
+
+        if name := self._names.get(channel_id):
+            self.hits += 1
+            return name
+
+        self.misses += 1
+        channel = await self._rest.fetch_channel(channel_id)
+
+        if channel.name is not None:
+            self._names[channel_id] = channel.name
+
+        return channel.name
+
+    def invalidate(self, channel_id: int) -> None:
+        self._names.pop(channel_id)
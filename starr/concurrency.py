@@ -0,0 +1,452 @@
+# Copyright (c) 2021-present, Jonxslays
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the
+#    distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from __future__ import annotations
+
+import asyncio
+import bisect
+import collections
+import heapq
+import logging
+import sys
+import threading
+import time
+import traceback
+import typing as t
+import weakref
+
+K = t.TypeVar("K")
+CallbackT = t.Callable[[], t.Awaitable[None]]
+
+_log = logging.getLogger(__name__)
+
+
+class KeyedLock(t.Generic[K]):
+    """A lock per key. Each lock is only kept around while something
+    holds it or is waiting on it, so the table never grows unbounded.
+    """
+
+    __slots__ = ("_locks",)
+
+    def __init__(self) -> None:
+        self._locks: weakref.WeakValueDictionary[K, asyncio.Lock] = weakref.WeakValueDictionary()
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+    def __getitem__(self, key: K) -> asyncio.Lock:
+        if (lock := self._locks.get(key)) is None:
+            lock = asyncio.Lock()
+            self._locks[key] = lock
+
+        return lock
+
+
+class RateLimiter:
+    """Spaces calls out so no more than `rate` happen per `per`
+    seconds, allowing short bursts up to `rate`."""
+
+    __slots__ = ("_rate", "_per", "_tokens", "_updated", "_lock")
+
+    def __init__(self, rate: int, per: float) -> None:
+        self._rate = rate
+        self._per = per
+        self._tokens = float(rate)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                refill = (now - self._updated) * self._rate / self._per
+                self._tokens = min(self._tokens + refill, self._rate)
+                self._updated = now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return None
+
+                await asyncio.sleep((1 - self._tokens) * self._per / self._rate)
+
+
+class _Pending:
+    __slots__ = ("callback", "first", "handle")
+
+    def __init__(self, callback: CallbackT, first: float, handle: asyncio.TimerHandle) -> None:
+        self.callback = callback
+        self.first = first
+        self.handle = handle
+
+
+class Debouncer(t.Generic[K]):
+    """Collapses bursts of calls for the same key into the latest one.
+
+    A call runs once no newer call for its key has come in for the
+    window, or once the max delay since the first call in the burst has
+    passed, whichever is sooner.
+    """
+
+    __slots__ = ("_window", "_max_delay", "_pending", "_running")
+
+    def __init__(self, window: float = 2, max_delay: float = 10) -> None:
+        self._window = window
+        self._max_delay = max_delay
+        self._pending: dict[K, _Pending] = {}
+        self._running: dict[K, asyncio.Task[None]] = {}
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def submit(self, key: K, callback: CallbackT) -> None:
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+
+        if pending := self._pending.get(key):
+            pending.handle.cancel()
+            first = pending.first
+        else:
+            first = now
+
+        delay = max(min(self._window, first + self._max_delay - now), 0)
+        handle = loop.call_later(delay, self._fire, key)
+        self._pending[key] = _Pending(callback, first, handle)
+
+    def cancel(self, key: K) -> None:
+        """Drop the pending call for this key, if there is one."""
+        if pending := self._pending.pop(key, None):
+            pending.handle.cancel()
+
+    async def close(self) -> None:
+        """Run every pending call now, and wait for them to finish."""
+        for pending in self._pending.values():
+            pending.handle.cancel()
+
+        for key in [*self._pending]:
+            self._fire(key)
+
+        if self._running:
+            await asyncio.wait(self._running.values())
+
+    def _fire(self, key: K) -> None:
+        pending = self._pending.pop(key)
+        previous = self._running.get(key)
+
+        async def run() -> None:
+            if previous:
+                # Calls for the same key never overlap.
+                await asyncio.wait((previous,))
+
+            await pending.callback()
+
+        task = asyncio.create_task(run())
+        self._running[key] = task
+        task.add_done_callback(lambda _: self._on_done(key, task))
+
+    def _on_done(self, key: K, task: asyncio.Task[None]) -> None:
+        if self._running.get(key) is task:
+            del self._running[key]
+
+        if not task.cancelled() and (e := task.exception()):
+            _log.error("Debounced call for %s failed", key, exc_info=e)
+
+
+class _Work:
+    __slots__ = ("callback", "queued_at")
+
+    def __init__(self, callback: CallbackT, queued_at: float) -> None:
+        self.callback = callback
+        self.queued_at = queued_at
+
+
+class GuildQueues(t.Generic[K]):
+    """Runs work from a bounded queue per guild, taking turns between
+    guilds so one busy guild can't starve the others.
+
+    Work queued with the same key as work still waiting in that guild's
+    queue replaces it, keeping its place in line. If a guild's queue is
+    full, either the oldest waiting work or the new work is dropped.
+    """
+
+    __slots__ = (
+        "_workers",
+        "_maxsize",
+        "_per_guild",
+        "_overflow",
+        "_queues",
+        "_ready",
+        "_ready_set",
+        "_active",
+        "_wake",
+        "_tasks",
+        "_idle",
+        "_closing",
+        "dropped",
+    )
+
+    def __init__(
+        self,
+        workers: int = 16,
+        maxsize: int = 100,
+        per_guild: int = 2,
+        overflow: t.Literal["drop_oldest", "drop_newest"] = "drop_oldest",
+    ) -> None:
+        self._workers = workers
+        self._maxsize = maxsize
+        self._per_guild = per_guild
+        self._overflow = overflow
+        self._queues: dict[int, collections.OrderedDict[K, _Work]] = {}
+        self._ready: collections.deque[int] = collections.deque()
+        self._ready_set: set[int] = set()
+        self._active: collections.Counter[int] = collections.Counter()
+        self._wake = asyncio.Event()
+        self._tasks: list[asyncio.Task[None]] = []
+        # Set whenever nothing is queued or running.
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._closing = False
+        self.dropped: collections.Counter[int] = collections.Counter()
+
+    def depths(self) -> dict[int, int]:
+        return {guild_id: len(queue) for guild_id, queue in self._queues.items()}
+
+    def busiest(self, n: int) -> list[tuple[int, int, float]]:
+        """The guilds with the most work waiting, how much is waiting
+        and how long the oldest of it has waited, in seconds."""
+        now = time.monotonic()
+        return [
+            # Replaced work keeps its place, so the first is oldest.
+            (guild_id, len(queue), now - next(iter(queue.values())).queued_at)
+            for guild_id, queue in heapq.nlargest(
+                n, self._queues.items(), key=lambda item: len(item[1])
+            )
+        ]
+
+    def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self._workers)]
+
+    async def close(self, timeout: float = 10) -> None:
+        """Stop taking work, and give what is queued or running until
+        the timeout to finish before cancelling it."""
+        self._closing = True
+
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            _log.warning(
+                "Cancelling %s queued and %s running tasks after %ss",
+                sum(self.depths().values()),
+                sum(self._active.values()),
+                timeout,
+            )
+
+        for task in self._tasks:
+            task.cancel()
+
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    def submit(self, guild_id: int, key: K, callback: CallbackT) -> bool:
+        """Queue some work, returning False if it was dropped."""
+        if self._closing:
+            return False
+
+        queue = self._queues.setdefault(guild_id, collections.OrderedDict())
+
+        if work := queue.get(key):
+            work.callback = callback
+            return True
+
+        if len(queue) >= self._maxsize:
+            self.dropped[guild_id] += 1
+
+            if self._overflow == "drop_newest":
+                return False
+
+            queue.popitem(last=False)
+
+        queue[key] = _Work(callback, time.monotonic())
+        self._idle.clear()
+        self._mark_ready(guild_id)
+        return True
+
+    def _mark_ready(self, guild_id: int) -> None:
+        if (
+            guild_id in self._ready_set
+            or not self._queues.get(guild_id)
+            or self._active[guild_id] >= self._per_guild
+        ):
+            return None
+
+        self._ready.append(guild_id)
+        self._ready_set.add(guild_id)
+        self._wake.set()
+
+    async def _work(self) -> None:
+        while True:
+            while not self._ready:
+                self._wake.clear()
+                await self._wake.wait()
+
+            guild_id = self._ready.popleft()
+            self._ready_set.discard(guild_id)
+            queue = self._queues[guild_id]
+            _, work = queue.popitem(last=False)
+
+            if not queue:
+                del self._queues[guild_id]
+
+            self._active[guild_id] += 1
+            # Back of the line, behind every other guild.
+            self._mark_ready(guild_id)
+
+            try:
+                await work.callback()
+            except Exception:
+                _log.exception("Queued work for guild %s failed", guild_id)
+            finally:
+                self._active[guild_id] -= 1
+
+                if not self._active[guild_id]:
+                    del self._active[guild_id]
+
+                self._mark_ready(guild_id)
+
+                if not self._queues and not self._active:
+                    self._idle.set()
+
+
+class LoopMonitor:
+    """Measures how late the event loop runs a callback scheduled at a
+    fixed interval, and logs what is blocking it when it falls too far
+    behind.
+
+    Stalls are caught from a separate thread, because by the time the
+    loop can notice it was blocked, the culprit has already finished.
+    """
+
+    # Upper bounds in seconds, with everything slower in the last.
+    BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, float("inf"))
+
+    __slots__ = (
+        "_interval",
+        "_threshold",
+        "_samples",
+        "_beat",
+        "_reported",
+        "_loop",
+        "_thread_id",
+        "_task",
+        "_stop",
+        "buckets",
+        "total",
+        "count",
+        "stalls",
+    )
+
+    def __init__(
+        self, interval: float = 0.25, threshold: float = 0.25, window: int = 1200
+    ) -> None:
+        self._interval = interval
+        self._threshold = threshold
+        # The last `window` samples, five minutes by default.
+        self._samples: collections.deque[float] = collections.deque(maxlen=window)
+        self._beat = time.monotonic()
+        self._reported = False
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread_id = 0
+        self._task: asyncio.Task[None] | None = None
+        self._stop = threading.Event()
+        # Totals since start, per bucket.
+        self.buckets = [0] * len(self.BUCKETS)
+        self.total = 0.0
+        self.count = 0
+        self.stalls = 0
+
+    def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._task = asyncio.create_task(self._sample())
+        threading.Thread(target=self._watch, name="loop-monitor", daemon=True).start()
+
+    def close(self) -> None:
+        self._stop.set()
+
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def record(self, lag: float) -> None:
+        self._samples.append(lag)
+        self.buckets[bisect.bisect_left(self.BUCKETS, lag)] += 1
+        self.total += lag
+        self.count += 1
+
+    def percentile(self, p: float) -> float:
+        """The lag at percentile `p` over the recent samples."""
+        if not self._samples:
+            return 0.0
+
+        samples = sorted(self._samples)
+        return samples[min(int(len(samples) * p / 100), len(samples) - 1)]
+
+    @property
+    def max(self) -> float:
+        return max(self._samples, default=0.0)
+
+    async def _sample(self) -> None:
+        while True:
+            before = time.monotonic()
+            await asyncio.sleep(self._interval)
+            self._beat = time.monotonic()
+            self._reported = False
+            self.record(max(self._beat - before - self._interval, 0.0))
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self._threshold / 2):
+            stalled = time.monotonic() - self._beat - self._interval
+
+            if stalled < self._threshold or self._reported:
+                continue
+
+            # Only once per stall, the loop resets this when it runs.
+            self._reported = True
+            self.stalls += 1
+            frame = sys._current_frames().get(self._thread_id)
+            task = asyncio.current_task(self._loop) if self._loop else None
+            stack = "".join(traceback.format_stack(frame)) if frame else "unavailable"
+            _log.warning(
+                "Event loop blocked for %.3fs in task %s\n%s",
+                stalled,
+                task.get_name() if task else None,
+                stack,
+            )
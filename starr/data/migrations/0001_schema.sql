@@ -11,6 +11,13 @@ CREATE TABLE IF NOT EXISTS starboard_messages (
     ReferenceID BIGINT NOT NULL UNIQUE
 );
 
+ALTER TABLE starboard_messages ADD COLUMN IF NOT EXISTS ChannelID BIGINT;
+
+CREATE TABLE IF NOT EXISTS starboard_checkpoints (
+    ChannelID BIGINT NOT NULL PRIMARY KEY,
+    MessageID BIGINT NOT NULL
+);
+
 CREATE TABLE IF NOT EXISTS tags (
     GuildID BIGINT,
     TagOwner BIGINT,
@@ -0,0 +1,6 @@
+-- tag list, for the whole guild or one owner, most used first.
+CREATE INDEX IF NOT EXISTS tags_guild_uses ON tags (GuildID, Uses DESC);
+CREATE INDEX IF NOT EXISTS tags_guild_owner_uses ON tags (GuildID, TagOwner, Uses DESC);
+
+-- Aliases by the tag they point to, this also backs the foreign key.
+CREATE INDEX IF NOT EXISTS tag_aliases_guild_tagname ON tag_aliases (GuildID, TagName);
@@ -0,0 +1,12 @@
+-- Resolves a guild's tag by its name, or failing that one of its
+-- aliases, and counts a use of it in the same round trip. Both
+-- lookups are primary key scans scoped to the guild.
+CREATE OR REPLACE FUNCTION use_tag(tag_guild BIGINT, tag_name TEXT)
+RETURNS TABLE (TagName TEXT, TagOwner BIGINT, TagContent TEXT, Uses BIGINT) AS $$
+    UPDATE tags t SET Uses = t.Uses + 1
+    WHERE t.GuildID = tag_guild AND t.TagName = COALESCE(
+        (SELECT n.TagName FROM tags n WHERE n.GuildID = tag_guild AND n.TagName = tag_name),
+        (SELECT a.TagName FROM tag_aliases a WHERE a.GuildID = tag_guild AND a.TagAlias = tag_name)
+    )
+    RETURNING t.TagName, t.TagOwner, t.TagContent, t.Uses;
+$$ LANGUAGE sql;
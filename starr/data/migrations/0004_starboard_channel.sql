@@ -0,0 +1,3 @@
+-- Reconciling finds the starboard rows for a range of one channel.
+CREATE INDEX IF NOT EXISTS starboard_messages_channel_reference
+    ON starboard_messages (ChannelID, ReferenceID);
@@ -0,0 +1,8 @@
+-- tag list pages by (uses, tagname), in either direction, with no
+-- sort. These replace the indexes on uses alone.
+CREATE INDEX IF NOT EXISTS tags_guild_uses_name ON tags (GuildID, Uses DESC, TagName);
+CREATE INDEX IF NOT EXISTS tags_guild_owner_uses_name
+    ON tags (GuildID, TagOwner, Uses DESC, TagName);
+
+DROP INDEX IF EXISTS tags_guild_uses;
+DROP INDEX IF EXISTS tags_guild_owner_uses;
@@ -32,12 +32,138 @@
 from __future__ import annotations
 
 import asyncio
+import collections
+import contextlib
 import functools
+import json
+import logging
+import os
+import re
+import time
 import typing as t
 from os import environ
 
 import asyncpg
 
+from starr import metrics
+from starr.queries import QUERIES
+
+_log = logging.getLogger(__name__)
+
+# Hot queries that should never need a sequential scan, with
+# placeholder arguments to plan them with.
+PLAN_CHECKS: dict[str, tuple[t.Any, ...]] = {
+    "tag_list": (0, 0, "", 5),
+    "tag_list_reverse": (0, 0, "", 5),
+    "tag_list_by_owner": (0, 0, 0, "", 5),
+    "tag_list_by_owner_reverse": (0, 0, 0, "", 5),
+    "tag_count": (0,),
+    "tag_count_by_owner": (0, 0),
+    "tag_index_load": (0,),
+    "tag_aliases_delete": (0, ""),
+    "starboard_select_batch": ([0], 0),
+    "starboard_select_range": (0, 0, 0),
+}
+
+
+class Statements:
+    """A registry of named queries. asyncpg's statement cache prepares
+    each of them once per connection, the first time it runs there."""
+
+    __slots__ = ("_queries", "hits")
+
+    def __init__(self, queries: dict[str, str]) -> None:
+        self._queries = dict(queries)
+        self.hits: collections.Counter[str] = collections.Counter()
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._queries
+
+    def __getitem__(self, name: str) -> str:
+        return self._queries[name]
+
+    def sql(self, q: str) -> str:
+        """The sql for a query, which can be either the name of a
+        registered statement or raw sql."""
+        if q not in self._queries:
+            return q
+
+        self.hits[q] += 1
+        return self._queries[q]
+
+    def report(self) -> list[tuple[str, int]]:
+        """The hit count for each statement, most used first."""
+        return [(n, self.hits[n]) for n in sorted(self._queries, key=lambda n: -self.hits[n])]
+
+
+class QueryStat:
+    """Timings for one statement, in seconds."""
+
+    __slots__ = ("calls", "total", "max", "acquire")
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.acquire = 0.0
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.calls if self.calls else 0.0
+
+
+class QueryStats:
+    """Query timings aggregated by statement, logging any that take
+    longer than `slow` seconds."""
+
+    __slots__ = ("slow", "stats")
+
+    # Literals would give every query its own entry.
+    LITERALS = re.compile(r"'(?:[^']|'')*'|(?<![\w$])\d+(?:\.\d+)?\b")
+
+    def __init__(self, slow: float | None = None) -> None:
+        self.slow = slow if slow is not None else int(environ.get("SLOW_QUERY_MS") or 100) / 1000
+        self.stats: dict[str, QueryStat] = collections.defaultdict(QueryStat)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=256)
+    def normalize(q: str) -> str:
+        """Collapse raw sql into a key shared by every call of it."""
+        return QueryStats.LITERALS.sub("?", " ".join(q.split()))[:120]
+
+    @staticmethod
+    def redact(values: t.Sequence[t.Any]) -> str:
+        """Describe query parameters without revealing them."""
+        return ", ".join(
+            f"{type(v).__name__}[{len(v)}]"
+            if isinstance(v, (str, bytes, list, tuple))
+            else type(v).__name__
+            for v in values
+        )
+
+    def record(
+        self, statement: str, acquire: float, elapsed: float, values: t.Sequence[t.Any]
+    ) -> None:
+        """Record one call of a statement."""
+        stat = self.stats[statement]
+        stat.calls += 1
+        stat.total += elapsed
+        stat.acquire += acquire
+        stat.max = max(stat.max, elapsed)
+
+        if elapsed >= self.slow:
+            _log.warning(
+                "Slow query %s took %.1f ms (waited %.1f ms for a connection) with (%s)",
+                statement,
+                elapsed * 1000,
+                acquire * 1000,
+                self.redact(values),
+            )
+
+    def top(self, n: int) -> list[tuple[str, QueryStat]]:
+        """The `n` statements with the most total time."""
+        return sorted(self.stats.items(), key=lambda s: -s[1].total)[:n]
+
 
 class Database:
     """Wrapper class for AsyncPG Database access."""
@@ -48,51 +174,205 @@ class Database:
         self.user = environ["PG_USER"]
         self.password = environ["PG_PASS"]
         self.port = environ["PG_PORT"]
-        self.schema = "./starr/data/schema.sql"
+        self.migrations = "./starr/data/migrations"
+        self.statements = Statements(QUERIES)
+        self.query_stats = QueryStats()
 
     async def connect(self) -> None:
         """Opens a connection pool."""
+        options: dict[str, t.Any] = {
+            "user": self.user,
+            "host": self.host,
+            "port": self.port,
+            "database": self.db,
+            "password": self.password,
+        }
+
+        # The schema is brought up to date before the pool opens.
+        conn: asyncpg.Connection = await asyncpg.connect(**options)
+
+        try:
+            await self.migrate(conn)
+            await self.check_plans(conn)
+        finally:
+            await conn.close()
+
         self.pool: asyncpg.Pool = await asyncpg.create_pool(
-            user=self.user,
-            host=self.host,
-            port=self.port,
-            database=self.db,
-            password=self.password,
+            **options,
             loop=asyncio.get_running_loop(),
         )
 
-        await self.scriptexec(self.schema)
-
     async def close(self) -> None:
         """Closes the connection pool."""
         await self.pool.close()
 
+    def pending_migrations(self, applied: set[int]) -> list[tuple[int, str]]:
+        """The migrations not applied yet, as (version, filename)
+        pairs in the order they have to run."""
+        migrations = []
+
+        for filename in os.listdir(self.migrations):
+            version, _, _ = filename.partition("_")
+
+            if filename.endswith(".sql") and int(version) not in applied:
+                migrations.append((int(version), filename))
+
+        return sorted(migrations)
+
+    async def migrate(self, conn: asyncpg.Connection) -> None:
+        """Apply any migrations the database hasn't seen yet."""
+        async with conn.transaction():
+            # Workers starting together take turns.
+            await conn.execute("SELECT pg_advisory_xact_lock(hashtext('starr_migrations'));")
+            await conn.execute(
+                "CREATE TABLE IF NOT EXISTS schema_migrations ("
+                "Version INT NOT NULL PRIMARY KEY, "
+                "Name TEXT NOT NULL, "
+                "AppliedAt TIMESTAMPTZ NOT NULL DEFAULT now());"
+            )
+            applied = {r[0] for r in await conn.fetch("SELECT Version FROM schema_migrations;")}
+
+            for version, filename in self.pending_migrations(applied):
+                with open(os.path.join(self.migrations, filename)) as script:
+                    await conn.execute(script.read())
+
+                await conn.execute(
+                    "INSERT INTO schema_migrations (Version, Name) VALUES ($1, $2);",
+                    version,
+                    filename,
+                )
+                _log.info("Applied migration %s", filename)
+
+    async def check_plans(self, conn: asyncpg.Connection) -> None:
+        """Warn about hot queries that no index can serve."""
+        async with conn.transaction():
+            # Small tables are quicker to scan, so the planner is
+            # told to use an index whenever there is one.
+            await conn.execute("SET LOCAL enable_seqscan = off;")
+
+            for name, args in PLAN_CHECKS.items():
+                plan = await conn.fetchval(f"EXPLAIN (FORMAT JSON) {self.statements[name]}", *args)
+
+                if scans := [*self.seq_scans(json.loads(plan)[0]["Plan"])]:
+                    _log.warning("%s needs a sequential scan of %s", name, ", ".join(scans))
+
+    @staticmethod
+    def seq_scans(plan: dict[str, t.Any]) -> t.Iterator[str]:
+        """The tables a query plan scans sequentially."""
+        if plan["Node Type"] == "Seq Scan":
+            yield plan["Relation Name"]
+
+        for child in plan.get("Plans", ()):
+            yield from Database.seq_scans(child)
+
     @staticmethod
     def with_connection(func: t.Callable[..., t.Any]) -> t.Callable[..., t.Any]:
         """A decorator used to acquire a connection from the pool."""
 
         @functools.wraps(func)
-        async def wrapper(self: Database, *args: t.Any) -> t.Any:
+        async def wrapper(
+            self: Database, *args: t.Any, conn: asyncpg.Connection | None = None
+        ) -> t.Any:
+            if conn is not None:
+                # A transaction already holds a connection.
+                return await self.timed(func, conn, 0.0, *args)
+
+            start = time.perf_counter()
+
             async with self.pool.acquire() as conn:
-                return await func(self, *args, conn=conn)
+                acquire = time.perf_counter() - start
+                metrics.DB_ACQUIRE_SECONDS.observe(acquire)
+                return await self.timed(func, conn, acquire, *args)
 
         return wrapper
 
+    async def timed(
+        self,
+        func: t.Callable[..., t.Awaitable[t.Any]],
+        conn: asyncpg.Connection,
+        acquire: float,
+        *args: t.Any,
+    ) -> t.Any:
+        start = time.perf_counter()
+
+        try:
+            return await func(self, *args, conn=conn)
+        finally:
+            elapsed = time.perf_counter() - start
+            statement = self.statement_name(args[0])
+            metrics.DB_QUERY_SECONDS.observe(elapsed, statement)
+            self.query_stats.record(statement, acquire, elapsed, args[1:])
+
+    @contextlib.asynccontextmanager
+    async def transaction(self) -> t.AsyncIterator[Transaction]:
+        """Run several statements on one connection, committing them
+        together when the block exits, or rolling them all back if it
+        raises."""
+        start = time.perf_counter()
+
+        async with self.pool.acquire() as conn:
+            metrics.DB_ACQUIRE_SECONDS.observe(time.perf_counter() - start)
+
+            async with conn.transaction():
+                yield Transaction(self, conn)
+
+    async def stream(
+        self, q: str, *values: t.Any, chunk: int = 500
+    ) -> t.AsyncIterator[asyncpg.Record]:
+        """Read rows through a server side cursor, `chunk` rows at a
+        time, so only one chunk is ever held in memory.
+
+        The connection is held until the iteration finishes, so keep
+        the loop body quick, and use `contextlib.aclosing` if it can
+        stop early."""
+        start = time.perf_counter()
+
+        async with self.pool.acquire() as conn:
+            acquire = time.perf_counter() - start
+            metrics.DB_ACQUIRE_SECONDS.observe(acquire)
+            elapsed = 0.0
+
+            try:
+                # Cursors only live as long as their transaction.
+                async with conn.transaction():
+                    cursor = await conn.cursor(self.statements.sql(q), *values)
+
+                    while True:
+                        fetched = time.perf_counter()
+                        rows = await cursor.fetch(chunk)
+                        elapsed += time.perf_counter() - fetched
+
+                        for row in rows:
+                            yield row
+
+                        if len(rows) < chunk:
+                            break
+
+            finally:
+                statement = self.statement_name(q)
+                metrics.DB_QUERY_SECONDS.observe(elapsed, statement)
+                self.query_stats.record(statement, acquire, elapsed, values)
+
+    def statement_name(self, q: object) -> str:
+        """The registered name of a query, or its normalized sql."""
+        if isinstance(q, str) and q in self.statements:
+            return q
+
+        return QueryStats.normalize(str(q))
+
     @with_connection
     async def fetch_one(
         self, q: str, *values: tuple[t.Any], conn: asyncpg.Connection
     ) -> t.Any | None:
         """Read 1 field of applicable data."""
-        query = await conn.prepare(q)
-        return await query.fetchval(*values)
+        return await conn.fetchval(self.statements.sql(q), *values)
 
     @with_connection
     async def fetch_row(
         self, q: str, *values: t.Any, conn: asyncpg.Connection
     ) -> t.Optional[t.List[t.Any]]:
         """Read 1 row of applicable data."""
-        query = await conn.prepare(q)
-        if data := await query.fetchrow(*values):
+        if data := await conn.fetchrow(self.statements.sql(q), *values):
             return [r for r in data]
 
         return None
@@ -102,8 +382,7 @@ class Database:
         self, q: str, *values: t.Any, conn: asyncpg.Connection
     ) -> t.Optional[t.List[t.Iterable[t.Any]]]:
         """Read all rows of applicable data."""
-        query = await conn.prepare(q)
-        if data := await query.fetch(*values):
+        if data := await conn.fetch(self.statements.sql(q), *values):
             return [*map(lambda r: tuple(r.values()), data)]
 
         return None
@@ -113,25 +392,62 @@ class Database:
         self, q: str, *values: t.Any, conn: asyncpg.Connection
     ) -> t.List[t.Any]:
         """Read a single column of applicable data."""
-        query = await conn.prepare(q)
-        return [r[0] for r in await query.fetch(*values)]
+        return [r[0] for r in await conn.fetch(self.statements.sql(q), *values)]
 
     @with_connection
     async def execute(self, q: str, *values: t.Any, conn: asyncpg.Connection) -> None:
         """Execute a write operation on the database."""
-        query = await conn.prepare(q)
-        await query.fetch(*values)
+        await conn.execute(self.statements.sql(q), *values)
 
     @with_connection
     async def executemany(
         self, q: str, values: t.List[t.Iterable[t.Any]], conn: asyncpg.Connection
     ) -> None:
         """Execute a write operation for each set of values."""
-        query = await conn.prepare(q)
-        await query.executemany(values)
+        await conn.executemany(self.statements.sql(q), values)
 
     @with_connection
     async def scriptexec(self, path: str, conn: asyncpg.Connection) -> None:
         """Execute an sql script at a given path."""
         with open(path) as script:
             await conn.execute(script.read())
+
+
+class Transaction:
+    """A unit of work from `Database.transaction`, with the same
+    methods as `Database` but every statement runs on one connection."""
+
+    __slots__ = ("_db", "_conn")
+
+    def __init__(self, db: Database, conn: asyncpg.Connection) -> None:
+        self._db = db
+        self._conn = conn
+
+    async def fetch_one(self, q: str, *values: t.Any) -> t.Any | None:
+        """Read 1 field of applicable data."""
+        return await self._db.fetch_one(q, *values, conn=self._conn)
+
+    async def fetch_row(self, q: str, *values: t.Any) -> t.Optional[t.List[t.Any]]:
+        """Read 1 row of applicable data."""
+        row: t.Optional[t.List[t.Any]] = await self._db.fetch_row(q, *values, conn=self._conn)
+        return row
+
+    async def fetch_rows(self, q: str, *values: t.Any) -> t.Optional[t.List[t.Iterable[t.Any]]]:
+        """Read all rows of applicable data."""
+        rows: t.Optional[t.List[t.Iterable[t.Any]]] = await self._db.fetch_rows(
+            q, *values, conn=self._conn
+        )
+        return rows
+
+    async def fetch_column(self, q: str, *values: t.Any) -> t.List[t.Any]:
+        """Read a single column of applicable data."""
+        column: t.List[t.Any] = await self._db.fetch_column(q, *values, conn=self._conn)
+        return column
+
+    async def execute(self, q: str, *values: t.Any) -> None:
+        """Execute a write operation on the database."""
+        await self._db.execute(q, *values, conn=self._conn)
+
+    async def executemany(self, q: str, values: t.List[t.Iterable[t.Any]]) -> None:
+        """Execute a write operation for each set of values."""
+        await self._db.executemany(q, values, conn=self._conn)
@@ -0,0 +1,207 @@
+# Copyright (c) 2021-present, Jonxslays
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the
+#    distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import typing as t
+from os import environ
+
+import hikari
+
+from starr import metrics
+from starr.bot import INTENTS
+from starr.bus import BusServer
+from starr.bus import encode
+from starr.db import Database
+
+_log = logging.getLogger(__name__)
+
+# Must match the stars plugin.
+STAR = "\u2B50"
+DEFAULT_PREFIX = "./"
+
+# Events a worker needs to keep its cache in line with ours, every
+# worker gets READY, the rest only go to the guild's worker.
+STATE_EVENTS = frozenset(
+    (
+        "READY",
+        "GUILD_CREATE",
+        "GUILD_UPDATE",
+        "GUILD_DELETE",
+        "GUILD_ROLE_CREATE",
+        "GUILD_ROLE_UPDATE",
+        "GUILD_ROLE_DELETE",
+        "CHANNEL_CREATE",
+        "CHANNEL_UPDATE",
+        "CHANNEL_DELETE",
+        "THREAD_CREATE",
+        "THREAD_UPDATE",
+        "THREAD_DELETE",
+    )
+)
+
+# Events only one worker handles, if they are relevant to us.
+STAR_EVENTS = frozenset(
+    (
+        "MESSAGE_REACTION_ADD",
+        "MESSAGE_REACTION_REMOVE",
+        "MESSAGE_REACTION_REMOVE_EMOJI",
+    )
+)
+DELETE_EVENTS = frozenset(("MESSAGE_REACTION_REMOVE_ALL", "MESSAGE_DELETE"))
+
+
+class Gateway:
+    """Holds the shard connections, and forwards the events the bot
+    cares about to worker processes over the bus.
+
+    The gateway keeps no cache of its own and doesn't deserialize
+    events, so workers can be restarted without any shard having to
+    reconnect.
+    """
+
+    __slots__ = ("bot", "db", "bus", "metrics", "prefixes", "my_id", "_refresh_every", "_task")
+
+    def __init__(self, bus_path: str | None = None, refresh_every: float = 60) -> None:
+        self.bot = hikari.GatewayBot(
+            environ["TOKEN"],
+            intents=INTENTS,
+            cache_settings=hikari.impl.CacheSettings(components=hikari.api.CacheComponents.NONE),
+        )
+        self.db = Database()
+        self.bus = BusServer(bus_path)
+        self.metrics = metrics.MetricsServer()
+        self.prefixes: dict[int, str] = {}
+        self.my_id = 0
+        self._refresh_every = refresh_every
+        self._task: asyncio.Task[None] | None = None
+
+        self.bot.subscribe(hikari.StartingEvent, self.on_starting)
+        self.bot.subscribe(hikari.StoppingEvent, self.on_stopping)
+        self.bot.subscribe(hikari.ShardPayloadEvent, self.on_payload)
+        metrics.registry.collector(
+            "starr_bus_workers", "Connected workers.", "gauge", self._workers
+        )
+        metrics.registry.collector(
+            "starr_bus_dropped_total", "Frames dropped by the bus.", "counter", self._dropped
+        )
+
+    def _workers(self) -> list[metrics.Sample]:
+        return [("", {}, self.bus.workers)]
+
+    def _dropped(self) -> list[metrics.Sample]:
+        return [("", {}, self.bus.dropped)]
+
+    def run(self, shard_count: int | None = None) -> None:
+        self.bot.run(
+            status=hikari.Status.IDLE,
+            activity=hikari.Activity(
+                name="the stars!",
+                type=hikari.ActivityType.WATCHING,
+            ),
+            shard_count=shard_count,
+        )
+
+    async def on_starting(self, _: hikari.StartingEvent) -> None:
+        await self.db.connect()
+        await self.refresh_prefixes()
+        await self.bus.start()
+        await self.metrics.start()
+        self._task = asyncio.create_task(self._refresh_periodically())
+
+    async def on_stopping(self, _: hikari.StoppingEvent) -> None:
+        if self._task:
+            self._task.cancel()
+
+        await self.bus.close()
+        await self.metrics.close()
+        await self.db.close()
+
+    async def refresh_prefixes(self) -> None:
+        # Prefix changes are made by the workers, so they can take up
+        # to one refresh to be picked up here.
+        self.prefixes = {
+            guild_id: prefix.lower() async for guild_id, prefix in self.db.stream("guild_prefixes")
+        }
+
+    async def _refresh_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self._refresh_every)
+
+            try:
+                await self.refresh_prefixes()
+            except Exception:
+                _log.exception("Failed to refresh prefixes")
+
+    def is_command(self, payload: t.Mapping[str, t.Any]) -> bool:
+        if payload["author"].get("bot"):
+            return False
+
+        content: str = payload.get("content", "").lower()
+        guild_id = int(payload.get("guild_id", 0))
+        prefix = self.prefixes.get(guild_id, DEFAULT_PREFIX)
+        return content.startswith((prefix, f"<@{self.my_id}>", f"<@!{self.my_id}>"))
+
+    def is_relevant(self, name: str, payload: t.Mapping[str, t.Any]) -> bool:
+        if name in STAR_EVENTS:
+            return bool(payload["emoji"].get("name") == STAR)
+
+        if name == "MESSAGE_CREATE":
+            return self.is_command(payload)
+
+        return name in DELETE_EVENTS or name == "INTERACTION_CREATE"
+
+    async def on_payload(self, event: hikari.ShardPayloadEvent) -> None:
+        name = event.name
+        payload = t.cast("dict[str, t.Any]", event.payload)
+
+        if name in STATE_EVENTS:
+            if name == "READY":
+                self.my_id = int(payload["user"]["id"])
+
+            frame = encode(name, event.shard.id, event.shard.shard_count, payload)
+            guild_id = int(payload.get("guild_id") or payload.get("id") or 0)
+            self.bus.state.remember(name, event.shard.id, guild_id, frame)
+
+            if name == "READY":
+                self.bus.broadcast(frame)
+            else:
+                # A worker that is down gets this from the replay
+                # when it connects, so it isn't buffered.
+                self.bus.publish(guild_id, frame, buffer=False)
+
+        elif self.is_relevant(name, payload):
+            frame = encode(name, event.shard.id, event.shard.shard_count, payload)
+            # Keep a guild's events on one worker, so its starboard
+            # locks and queues still see all of them.
+            self.bus.publish(int(payload.get("guild_id", 0)), frame)
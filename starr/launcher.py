@@ -0,0 +1,294 @@
+# Copyright (c) 2021-present, Jonxslays
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the
+#    distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from __future__ import annotations
+
+import logging
+import logging.handlers
+import multiprocessing as mp
+import multiprocessing.process
+import multiprocessing.queues
+import signal
+import time
+import types
+import typing as t
+from os import environ
+
+import hikari
+
+from starr import utils
+from starr.bot import StarrBot
+from starr.bus import BusClient
+from starr.gateway import Gateway
+
+_log = logging.getLogger(__name__)
+
+# Discord only lets one shard identify every 5 seconds.
+_IDENTIFY_INTERVAL = 5.0
+# A worker that stays up this long has its restart backoff reset.
+_STABLE_AFTER = 300.0
+_MAX_BACKOFF = 60.0
+
+
+def run_bot(shard_ids: t.Sequence[int] | None = None, shard_count: int | None = None) -> None:
+    bot = StarrBot(shard_ids, shard_count)
+
+    bot.run(
+        status=hikari.Status.IDLE,
+        activity=hikari.Activity(
+            name="the stars!",
+            type=hikari.ActivityType.WATCHING,
+        ),
+        shard_ids=shard_ids,
+        shard_count=shard_count,
+    )
+
+
+def run_bus_worker(slot: int) -> None:
+    # The gateway routes each guild to the slot of its id, so this
+    # worker only keeps and reconciles the guilds in its own slot.
+    bot = StarrBot(bus_slot=(slot, int(environ.get("WORKERS") or 1)))
+    client = BusClient(bot, slot)
+
+    async def on_started(_: hikari.StartedEvent) -> None:
+        client.start()
+
+    async def on_stopping(_: hikari.StoppingEvent) -> None:
+        await client.close()
+
+    bot.subscribe(hikari.StartedEvent, on_started)
+    bot.subscribe(hikari.StoppingEvent, on_stopping)
+    # The gateway process owns the shards, events come over the bus.
+    bot.run(shard_ids=(), shard_count=1)
+
+
+def _run_worker(
+    queue: mp.queues.Queue[logging.LogRecord],
+    index: int,
+    shard_ids: list[int] | None,
+    shard_count: int | None,
+) -> None:
+    # Everything is logged through the supervisor, so only one
+    # process ever writes to the log files. Records are dropped and
+    # counted when the supervisor falls behind, as they are in a
+    # single process.
+    log = logging.getLogger("root")
+    log.setLevel(logging.INFO)
+    log.addHandler(utils.BoundedQueueHandler(queue))
+
+    # Each worker serves its own metrics, on the ports after the
+    # base one, which is left for a gateway process.
+    if port := int(environ.get("METRICS_PORT") or 9150):
+        environ["METRICS_PORT"] = str(port + 1 + index)
+
+    if shard_ids is None:
+        run_bus_worker(index)
+    else:
+        run_bot(shard_ids, shard_count)
+
+
+class Worker:
+    __slots__ = ("index", "shard_ids", "process", "started_at", "restarts", "restart_at")
+
+    def __init__(self, index: int, shard_ids: list[int] | None) -> None:
+        self.index = index
+        self.shard_ids = shard_ids
+        self.process: multiprocessing.process.BaseProcess | None = None
+        self.started_at = 0.0
+        self.restarts = 0
+        self.restart_at = 0.0
+
+
+class Supervisor:
+    """Runs the bot's shards across several worker processes, and
+    restarts any worker that exits.
+
+    Without a shard count the workers run no shards, and take their
+    events from a gateway process over the bus instead.
+    """
+
+    __slots__ = ("_shard_count", "_workers", "_ctx", "_queue", "_stopping", "_status_every")
+
+    def __init__(
+        self, workers: int, shard_count: int | None = None, status_every: float = 60
+    ) -> None:
+        if workers < 1 or (shard_count is not None and workers > shard_count):
+            raise ValueError("There must be between 1 and shard_count workers.")
+
+        self._shard_count = shard_count
+        self._workers = [
+            Worker(i, list(range(i, shard_count, workers)) if shard_count else None)
+            for i in range(workers)
+        ]
+        # Forking a process with a running event loop is unsafe.
+        self._ctx = mp.get_context("spawn")
+        self._queue: mp.queues.Queue[logging.LogRecord] = self._ctx.Queue(
+            int(environ.get("LOG_QUEUE_SIZE") or 10_000)
+        )
+        self._stopping = False
+        self._status_every = status_every
+
+    def run(self) -> None:
+        handlers = logging.getLogger("root").handlers
+        listener = logging.handlers.QueueListener(
+            self._queue, *handlers, respect_handler_level=True
+        )
+        listener.start()
+        signal.signal(signal.SIGINT, self._stop)
+        signal.signal(signal.SIGTERM, self._stop)
+
+        try:
+            for worker in self._workers:
+                self._start(worker)
+
+                # Give this worker's shards time to identify before
+                # the next worker starts on theirs.
+                self._sleep(len(worker.shard_ids or ()) * _IDENTIFY_INTERVAL)
+
+            self._supervise()
+
+        finally:
+            self._shutdown()
+            listener.stop()
+
+    def _start(self, worker: Worker) -> None:
+        if self._stopping:
+            return None
+
+        worker.process = self._ctx.Process(
+            target=_run_worker,
+            args=(self._queue, worker.index, worker.shard_ids, self._shard_count),
+            name=f"starr-worker-{worker.index}",
+        )
+        worker.process.start()
+        worker.started_at = time.monotonic()
+        _log.info(
+            "Started worker %s (pid %s) for shards %s",
+            worker.index,
+            worker.process.pid,
+            worker.shard_ids,
+        )
+
+    def _supervise(self) -> None:
+        last_status = time.monotonic()
+
+        while not self._stopping:
+            now = time.monotonic()
+
+            for worker in self._workers:
+                if worker.process and not worker.process.is_alive():
+                    self._on_exit(worker, now)
+
+                elif not worker.process and worker.restart_at <= now:
+                    self._start(worker)
+
+            if now - last_status >= self._status_every:
+                self._log_status()
+                last_status = now
+
+            self._sleep(1)
+
+    def _on_exit(self, worker: Worker, now: float) -> None:
+        assert worker.process is not None
+        _log.error(
+            "Worker %s (pid %s) exited with code %s",
+            worker.index,
+            worker.process.pid,
+            worker.process.exitcode,
+        )
+
+        if now - worker.started_at >= _STABLE_AFTER:
+            worker.restarts = 0
+
+        worker.process = None
+        worker.restart_at = now + min(2.0**worker.restarts, _MAX_BACKOFF)
+        worker.restarts += 1
+
+    def _log_status(self) -> None:
+        for worker in self._workers:
+            alive = worker.process is not None and worker.process.is_alive()
+            _log.info(
+                "Worker %s: shards=%s alive=%s pid=%s restarts=%s uptime=%.0fs",
+                worker.index,
+                worker.shard_ids,
+                alive,
+                worker.process.pid if worker.process else None,
+                worker.restarts,
+                time.monotonic() - worker.started_at if alive else 0,
+            )
+
+    def _sleep(self, seconds: float) -> None:
+        deadline = time.monotonic() + seconds
+
+        while not self._stopping and time.monotonic() < deadline:
+            time.sleep(min(1, deadline - time.monotonic()))
+
+    def _stop(self, signum: int, _: types.FrameType | None) -> None:
+        _log.info("Received %s, stopping workers", signal.Signals(signum).name)
+        self._stopping = True
+
+    def _shutdown(self) -> None:
+        self._stopping = True
+        processes = [w.process for w in self._workers if w.process]
+
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+        for process in processes:
+            process.join(30)
+
+            if process.is_alive():
+                _log.warning("Worker pid %s didn't stop, killing it", process.pid)
+                process.kill()
+                process.join()
+
+
+def launch() -> None:
+    # Set WORKERS to run the shards across processes, and optionally
+    # SHARD_COUNT, which defaults to one shard per worker.
+    #
+    # Or set BUS to gateway for a process that only holds the shards,
+    # and BUS to worker for the processes that handle its events.
+    utils.configure_logging()
+    workers = int(environ.get("WORKERS") or 0)
+    shard_count = int(environ.get("SHARD_COUNT") or 0) or None
+
+    if (bus := environ.get("BUS")) == "gateway":
+        return Gateway().run(shard_count)
+
+    if bus == "worker":
+        return Supervisor(workers or 1).run()
+
+    if not workers:
+        return run_bot()
+
+    Supervisor(workers, shard_count or workers).run()
@@ -0,0 +1,353 @@
+# Copyright (c) 2021-present, Jonxslays
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the
+#    distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from __future__ import annotations
+
+import abc
+import bisect
+import contextlib
+import functools
+import logging
+import time
+import typing as t
+from os import environ
+
+import hikari
+from aiohttp import web
+
+_log = logging.getLogger(__name__)
+
+Labels = t.Tuple[str, ...]
+# A sample is a name suffix, its labels and its value.
+Sample = t.Tuple[str, t.Dict[str, str], float]
+ListenerT = t.TypeVar("ListenerT", bound=t.Callable[..., t.Coroutine[t.Any, t.Any, None]])
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric(abc.ABC):
+    """Something the registry can render in the Prometheus text
+    format."""
+
+    kind = "untyped"
+
+    __slots__ = ("name", "help", "labels")
+
+    def __init__(self, name: str, help: str, labels: Labels = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labels = labels
+
+    def _labels(self, values: Labels) -> dict[str, str]:
+        return dict(zip(self.labels, values))
+
+    @abc.abstractmethod
+    def samples(self) -> t.Iterable[Sample]:
+        ...
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+        for suffix, labels, value in self.samples():
+            label_str = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+            label_str = f"{{{label_str}}}" if label_str else ""
+            lines.append(f"{self.name}{suffix}{label_str} {_format(value)}")
+
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    __slots__ = ("_values",)
+
+    def __init__(self, name: str, help: str, labels: Labels = ()) -> None:
+        super().__init__(name, help, labels)
+        self._values: dict[Labels, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self) -> t.Iterable[Sample]:
+        return [("", self._labels(k), v) for k, v in self._values.items()]
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    __slots__ = ("_values",)
+
+    def __init__(self, name: str, help: str, labels: Labels = ()) -> None:
+        super().__init__(name, help, labels)
+        self._values: dict[Labels, float] = {}
+
+    def set(self, value: float, *labels: str) -> None:
+        self._values[labels] = value
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def samples(self) -> t.Iterable[Sample]:
+        return [("", self._labels(k), v) for k, v in self._values.items()]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    __slots__ = ("_buckets", "_values")
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Labels = (),
+        buckets: t.Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, help, labels)
+        self._buckets = tuple(buckets)
+        # Per label set, the count in each bucket, then the sum.
+        self._values: dict[Labels, tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        if not (counts := self._values.get(labels)):
+            counts = self._values[labels] = ([0] * len(self._buckets), [0.0])
+
+        counts[0][bisect.bisect_left(self._buckets, value)] += 1
+        counts[1][0] += value
+
+    @contextlib.contextmanager
+    def time(self, *labels: str) -> t.Iterator[None]:
+        start = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def samples(self) -> t.Iterable[Sample]:
+        for labels, (counts, total) in self._values.items():
+            yield from histogram_samples(self._labels(labels), self._buckets, counts, total[0])
+
+
+def histogram_samples(
+    labels: dict[str, str], buckets: t.Sequence[float], counts: t.Sequence[int], total: float
+) -> t.Iterator[Sample]:
+    cumulative = 0
+
+    for bound, count in zip(buckets, counts):
+        cumulative += count
+        yield "_bucket", {**labels, "le": _format(bound)}, cumulative
+
+    yield "_sum", labels, total
+    yield "_count", labels, cumulative
+
+
+class Collector(Metric):
+    """A metric read from somewhere else each time it is scraped."""
+
+    __slots__ = ("kind", "_collect")
+
+    def __init__(
+        self, name: str, help: str, kind: str, collect: t.Callable[[], t.Iterable[Sample]]
+    ) -> None:
+        super().__init__(name, help)
+        self.kind = kind
+        self._collect = collect
+
+    def samples(self) -> t.Iterable[Sample]:
+        return self._collect()
+
+
+class Registry:
+    __slots__ = ("_metrics",)
+
+    def __init__(self) -> None:
+        self._metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> None:
+        # Replacing is allowed, so reloaded plugins can register again.
+        self._metrics[metric.name] = metric
+
+    def counter(self, name: str, help: str, labels: Labels = ()) -> Counter:
+        self.register(metric := Counter(name, help, labels))
+        return metric
+
+    def gauge(self, name: str, help: str, labels: Labels = ()) -> Gauge:
+        self.register(metric := Gauge(name, help, labels))
+        return metric
+
+    def histogram(self, name: str, help: str, labels: Labels = ()) -> Histogram:
+        self.register(metric := Histogram(name, help, labels))
+        return metric
+
+    def collector(
+        self, name: str, help: str, kind: str, collect: t.Callable[[], t.Iterable[Sample]]
+    ) -> None:
+        self.register(Collector(name, help, kind, collect))
+
+    def render(self) -> str:
+        out = []
+
+        for metric in self._metrics.values():
+            try:
+                out.append(metric.render())
+            except Exception:
+                _log.exception("Failed to collect %s", metric.name)
+
+        return "\n".join(out) + "\n"
+
+
+registry = Registry()
+
+EVENTS = registry.counter("starr_events_total", "Events handled by plugins.", ("event",))
+LISTENER_SECONDS = registry.histogram(
+    "starr_listener_seconds", "Time spent in plugin listeners.", ("event",)
+)
+COMMAND_SECONDS = registry.histogram(
+    "starr_command_seconds", "Time taken by commands.", ("command", "status")
+)
+DB_ACQUIRE_SECONDS = registry.histogram(
+    "starr_db_acquire_seconds", "Time spent waiting for a pooled connection."
+)
+DB_QUERY_SECONDS = registry.histogram(
+    "starr_db_query_seconds", "Time spent running statements.", ("statement",)
+)
+REST_SECONDS = registry.histogram(
+    "starr_rest_seconds", "Time taken by REST calls.", ("route", "status")
+)
+PAGINATOR_PAGES = registry.counter("starr_paginator_pages_total", "Pages shown by paginators.")
+PAGINATORS = registry.gauge("starr_paginators", "Paginators still listening for buttons.")
+
+
+def count_events(bot: hikari.GatewayBot, events: t.Iterable[t.Type[hikari.Event]]) -> None:
+    """Count each event once, however many listeners it has."""
+
+    def counter(name: str) -> t.Callable[[hikari.Event], t.Coroutine[t.Any, t.Any, None]]:
+        async def count(_: hikari.Event) -> None:
+            EVENTS.inc(name)
+
+        return count
+
+    for event in events:
+        bot.subscribe(event, counter(event.__name__))
+
+
+def timed_listener(event: str, func: ListenerT) -> ListenerT:
+    @functools.wraps(func)
+    async def wrapper(*args: t.Any, **kwargs: t.Any) -> t.Any:
+        with LISTENER_SECONDS.time(event):
+            return await func(*args, **kwargs)
+
+    return t.cast(ListenerT, wrapper)
+
+
+def instrument_rest() -> None:
+    """Time every REST call by its route.
+
+    hikari has no public hook for this, so this wraps the one private
+    method every request goes through, once for all clients.
+    """
+    rest = hikari.impl.RESTClientImpl
+    request = rest._request
+
+    if getattr(request, "__starr_timed__", False):
+        return None
+
+    @functools.wraps(request)
+    async def wrapper(self: t.Any, compiled_route: t.Any, *args: t.Any, **kwargs: t.Any) -> t.Any:
+        route = f"{compiled_route.method} {compiled_route.route.path_template}"
+        status = "ok"
+        start = time.perf_counter()
+
+        try:
+            return await request(self, compiled_route, *args, **kwargs)
+        except Exception as e:
+            status = type(e).__name__
+            raise
+        finally:
+            REST_SECONDS.observe(time.perf_counter() - start, route, status)
+
+    setattr(wrapper, "__starr_timed__", True)
+    setattr(rest, "_request", wrapper)
+
+
+class MetricsServer:
+    """Serves the registry at /metrics for Prometheus to scrape."""
+
+    __slots__ = ("_registry", "_host", "_port", "_runner")
+
+    def __init__(
+        self, registry: Registry = registry, host: str | None = None, port: int | None = None
+    ) -> None:
+        self._registry = registry
+        self._host = host or environ.get("METRICS_HOST") or "127.0.0.1"
+        self._port = port if port is not None else int(environ.get("METRICS_PORT") or 9150)
+        self._runner: web.AppRunner | None = None
+
+    @property
+    def enabled(self) -> bool:
+        return self._port > 0
+
+    async def start(self) -> None:
+        if not self.enabled:
+            return None
+
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self._host, self._port).start()
+        _log.info("Serving metrics on http://%s:%s/metrics", self._host, self._port)
+
+    async def close(self) -> None:
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle(self, _: web.Request) -> web.Response:
+        return web.Response(
+            body=self._registry.render().encode(),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+        )
@@ -31,13 +31,30 @@
 
 from __future__ import annotations
 
+import asyncio
+import collections
+import logging
+import sys
+import typing as t
+
 import hikari
 
+from starr.cache import ChannelNames
+from starr.cache import StarboardReferences
 from starr.db import Database
 
+_log = logging.getLogger(__name__)
+
 
 class StarrGuild:
-    __slots__ = ("_guild_id", "_prefix", "_star_channel", "_threshold", "_star_blacklist")
+    __slots__ = (
+        "_guild_id",
+        "_prefix",
+        "_star_channel",
+        "_threshold",
+        "_star_blacklist",
+        "changed",
+    )
 
     def __init__(
         self,
@@ -52,6 +69,8 @@ class StarrGuild:
         self._star_channel = star_channel
         self._threshold = threshold
         self._star_blacklist = star_blacklist
+        # Set once any setting is changed in memory.
+        self.changed = False
 
     @property
     def guild_id(self) -> int:
@@ -64,6 +83,7 @@ class StarrGuild:
     @prefix.setter
     def prefix(self, value: str) -> None:
         self._prefix = value
+        self.changed = True
 
     @property
     def star_channel(self) -> int:
@@ -72,6 +92,7 @@ class StarrGuild:
     @star_channel.setter
     def star_channel(self, value: int) -> None:
         self._star_channel = value
+        self.changed = True
 
     @property
     def star_blacklist(self) -> list[int]:
@@ -84,50 +105,87 @@ class StarrGuild:
     @threshold.setter
     def threshold(self, value: int) -> None:
         self._threshold = value
+        self.changed = True
 
     @classmethod
     async def from_db(cls, db: Database, guild_id: int) -> StarrGuild:
-        data = await db.fetch_row("SELECT * FROM guilds WHERE GuildID = $1;", guild_id)
+        data = await db.fetch_row("guild_select", guild_id)
         return cls(*data)
 
-    @classmethod
-    async def default_with_insert(cls, db: Database, guild_id: int) -> StarrGuild:
-        data = await db.fetch_row(
-            "INSERT INTO guilds (GuildID) VALUES ($1) ON CONFLICT DO NOTHING RETURNING *;",
-            guild_id,
-        )
-
-        if not data:
-            return await cls.from_db(db, guild_id)
-
-        return cls(*data)
-
-    async def add_channel_to_blacklist(self, db: Database, channel_id: int) -> None:
+    def add_channel_to_blacklist(self, channel_id: int) -> None:
         self._star_blacklist.append(channel_id)
-        await db.execute(
-            "UPDATE guilds "
-            "SET StarBlacklist = array_append(StarBlacklist, $1) "
-            "WHERE GuildID = $2;",
-            channel_id,
-            self._guild_id,
-        )
+        self.changed = True
 
-    async def remove_channel_from_blacklist(self, db: Database, channel_id: int) -> None:
+    def remove_channel_from_blacklist(self, channel_id: int) -> None:
         try:
             self._star_blacklist.remove(channel_id)
         except ValueError:
             pass
         else:
-            await db.execute(
-                "UPDATE guilds SET StarBlacklist = $1 WHERE GuildID = $2;",
-                self._star_blacklist,
-                self._guild_id,
-            )
+            self.changed = True
+
+
+class GuildBootstrap:
+    """Collects guilds that need loading for a short window, then
+    loads them all at once, inserting any that are new."""
+
+    __slots__ = ("_db", "_window", "_max_batch", "_pending", "_handle", "_tasks")
+
+    def __init__(self, db: Database, window: float = 0.5, max_batch: int = 1_000) -> None:
+        self._db = db
+        self._window = window
+        self._max_batch = max_batch
+        self._pending: dict[int, asyncio.Future[StarrGuild]] = {}
+        self._handle: asyncio.TimerHandle | None = None
+        # The loop only keeps weak references to tasks.
+        self._tasks: set[asyncio.Task[None]] = set()
+
+    async def get(self, guild_id: int) -> StarrGuild:
+        if not (future := self._pending.get(guild_id)):
+            future = asyncio.get_running_loop().create_future()
+            self._pending[guild_id] = future
+
+        if len(self._pending) >= self._max_batch:
+            self._flush()
+
+        elif not self._handle:
+            self._handle = asyncio.get_running_loop().call_later(self._window, self._flush)
+
+        return await asyncio.shield(future)
+
+    def _flush(self) -> None:
+        if self._handle:
+            self._handle.cancel()
+            self._handle = None
+
+        pending, self._pending = self._pending, {}
+        task = asyncio.create_task(self._load(pending))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _load(self, pending: dict[int, asyncio.Future[StarrGuild]]) -> None:
+        try:
+            rows = await self._db.fetch_rows("guild_bootstrap", [*pending]) or []
+
+        except Exception as e:
+            for future in pending.values():
+                future.set_exception(e)
+
+            return None
+
+        for row in rows:
+            guild = StarrGuild(*row)
+            pending.pop(guild.guild_id).set_result(guild)
+
+        for guild_id, future in pending.items():
+            future.set_exception(LookupError(f"Guild {guild_id} failed to load."))
 
 
 class StarboardMessage:
     __slots__ = ("_message_id", "_reference_id", "_guild")
 
+    references: t.ClassVar[StarboardReferences] = StarboardReferences()
+
     def __init__(self, message_id: int, reference_id: int, guild: StarrGuild) -> None:
         self._message_id = message_id
         self._reference_id = reference_id
@@ -145,20 +203,13 @@ class StarboardMessage:
     def guild(self) -> StarrGuild:
         return self._guild
 
-    async def db_insert(self, db: Database) -> None:
-        await db.execute(
-            "INSERT INTO starboard_messages (StarMessageID, ReferenceID) "
-            "VALUES ($1, $2) ON CONFLICT DO NOTHING;",
-            self._message_id,
-            self._reference_id,
-        )
+    async def db_insert(self, db: Database, channel_id: int) -> None:
+        await db.execute("starboard_insert", self._message_id, self._reference_id, channel_id)
+        self.references[self._reference_id] = self._message_id
 
     async def db_update(self, db: Database) -> None:
-        await db.execute(
-            "UPDATE starboard_messages SET StarMessageID = $1 WHERE ReferenceID = $2;",
-            self._message_id,
-            self._reference_id,
-        )
+        await db.execute("starboard_update", self._message_id, self._reference_id)
+        self.references[self._reference_id] = self._message_id
 
     async def delete(
         self,
@@ -172,27 +223,39 @@ class StarboardMessage:
             # The starboard message was already deleted.
             pass
 
-        await db.execute(
-            "DELETE FROM starboard_messages WHERE StarMessageID = $1;", self._message_id
-        )
+        await db.execute("starboard_delete", self._message_id)
+        self.references[self._reference_id] = None
 
     async def update(
         self,
         rest: hikari.api.RESTClient,
-        db: Database,
-        original_message: hikari.Message,
         count: int,
         guild: StarrGuild,
-    ) -> None:
+    ) -> bool:
+        """Edit the count on the starboard message, returning False if
+        the starboard message no longer exists."""
         try:
             await rest.edit_message(
                 guild.star_channel, self._message_id, f"You're a \u2B50 x{count}!\n"
             )
 
         except hikari.NotFoundError:
-            message = await self.create_new(rest, db, original_message, count, guild)
-            self._message_id = message.id
-            await self.db_update(db)
+            return False
+
+        return True
+
+    async def repost(
+        self,
+        rest: hikari.api.RESTClient,
+        db: Database,
+        channels: ChannelNames,
+        original_message: hikari.Message,
+        count: int,
+        guild: StarrGuild,
+    ) -> None:
+        message = await self.create_new(rest, db, channels, original_message, count, guild)
+        self._message_id = message.id
+        await self.db_update(db)
 
     @classmethod
     async def from_reference(
@@ -201,9 +264,11 @@ class StarboardMessage:
         reference_id: int,
         guild: StarrGuild,
     ) -> StarboardMessage | None:
-        data = await db.fetch_one(
-            "SELECT StarMessageID FROM starboard_messages WHERE ReferenceID = $1", reference_id
-        )
+        try:
+            data = cls.references[reference_id]
+        except KeyError:
+            data = await db.fetch_one("starboard_select", reference_id)
+            cls.references[reference_id] = data
 
         if data:
             return cls(data, reference_id, guild)
@@ -215,15 +280,16 @@ class StarboardMessage:
         cls,
         rest: hikari.api.RESTClient,
         db: Database,
+        channels: ChannelNames,
         original_message: hikari.Message,
         count: int,
         guild: StarrGuild,
     ) -> hikari.Message:
-        reference_channel = await rest.fetch_channel(original_message.channel_id)
+        channel_name = await channels.get(original_message.channel_id)
 
         embed = (
             hikari.Embed(
-                title=f"Jump to message in #{reference_channel.name}",
+                title=f"Jump to message in #{channel_name}",
                 url=original_message.make_link(guild.guild_id),
                 color=hikari.Color.from_hex_code("#fcd303"),
                 description=original_message.content,
@@ -247,5 +313,294 @@ class StarboardMessage:
         )
 
         starboard_message = cls(new_message.id, original_message.id, guild)
-        await starboard_message.db_insert(db)
+        await starboard_message.db_insert(db, original_message.channel_id)
         return new_message
+
+
+class TagUses:
+    """Buffers tag use increments in memory, and writes them to the
+    database in one batch per interval."""
+
+    __slots__ = ("_db", "_interval", "_pending", "_task")
+
+    def __init__(self, db: Database, interval: float = 30) -> None:
+        self._db = db
+        self._interval = interval
+        self._pending: collections.Counter[tuple[int, str]] = collections.Counter()
+        self._task: asyncio.Task[None] | None = None
+
+    def increment(self, guild_id: int, name: str) -> None:
+        self._pending[(guild_id, name)] += 1
+
+    def pending(self, guild_id: int, name: str) -> int:
+        return self._pending[(guild_id, name)]
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._flush_periodically())
+
+    async def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+            # A flush it was in the middle of puts its uses back.
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+        await self.flush()
+
+    async def flush(self) -> None:
+        if not self._pending:
+            return None
+
+        pending, self._pending = self._pending, collections.Counter()
+        guild_ids, names = zip(*pending)
+
+        try:
+            await self._db.execute(
+                "tag_uses_flush", list(guild_ids), list(names), list(pending.values())
+            )
+
+        except BaseException:
+            # Put them back so the next flush can try again, this
+            # includes being cancelled on close.
+            self._pending.update(pending)
+            raise
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self._interval)
+
+            try:
+                await self.flush()
+            except Exception:
+                _log.exception("Failed to flush %s tag uses", len(self._pending))
+
+
+class Tag:
+    __slots__ = ("_name", "_owner", "_content", "_uses", "_aliases")
+
+    def __init__(
+        self,
+        name: str,
+        owner: int,
+        content: str,
+        uses: int = 0,
+        aliases: t.Iterable[str] = (),
+    ) -> None:
+        self._name = name
+        self._owner = owner
+        self._content = content
+        self._uses = uses
+        self._aliases = set(aliases)
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def owner(self) -> int:
+        return self._owner
+
+    @owner.setter
+    def owner(self, value: int) -> None:
+        self._owner = value
+
+    @property
+    def content(self) -> str:
+        return self._content
+
+    @content.setter
+    def content(self, value: str) -> None:
+        self._content = value
+
+    @property
+    def uses(self) -> int:
+        return self._uses
+
+    @uses.setter
+    def uses(self, value: int) -> None:
+        self._uses = value
+
+    @property
+    def aliases(self) -> set[str]:
+        return self._aliases
+
+    @property
+    def size(self) -> int:
+        """A rough estimate of the bytes used by this tag."""
+        return (
+            sys.getsizeof(self)
+            + sys.getsizeof(self._name)
+            + sys.getsizeof(self._content)
+            + sum(sys.getsizeof(a) for a in self._aliases)
+        )
+
+
+class GuildTags:
+    """A guild's tags, resolvable by their name or an alias."""
+
+    __slots__ = ("_tags", "_aliases", "_size", "resized")
+
+    def __init__(self, tags: list[Tag]) -> None:
+        self._tags = {t.name: t for t in tags}
+        self._aliases = {a: t.name for t in tags for a in t.aliases}
+        self._size = sum(t.size for t in tags)
+        # Called with the change in size whenever it changes.
+        self.resized: t.Callable[[int], None] | None = None
+
+    def __len__(self) -> int:
+        return len(self._tags)
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def _resize(self, delta: int) -> None:
+        self._size += delta
+
+        if self.resized:
+            self.resized(delta)
+
+    def get(self, name: str) -> Tag | None:
+        """Get a tag by its exact name, ignoring aliases."""
+        return self._tags.get(name)
+
+    def resolve(self, name: str) -> Tag | None:
+        """Get a tag by its name, or one of its aliases."""
+        if tag := self._tags.get(name):
+            return tag
+
+        if real_name := self._aliases.get(name):
+            return self._tags.get(real_name)
+
+        return None
+
+    def add(self, tag: Tag) -> None:
+        self.remove(tag.name)
+        self._tags[tag.name] = tag
+        self._aliases.update((a, tag.name) for a in tag.aliases)
+        self._resize(tag.size)
+
+    def add_alias(self, tag: Tag, alias: str) -> None:
+        size = tag.size
+        tag.aliases.add(alias)
+        self._aliases[alias] = tag.name
+        self._resize(tag.size - size)
+
+    def edit(self, tag: Tag, content: str) -> None:
+        size = tag.size
+        tag.content = content
+        self._resize(tag.size - size)
+
+    def remove(self, name: str) -> None:
+        if tag := self._tags.pop(name, None):
+            for alias in tag.aliases:
+                self._aliases.pop(alias, None)
+
+            self._resize(-tag.size)
+
+
+class TagIndex:
+    """Lazily loaded tags for each guild, evicting the least recently
+    used guilds once the memory budget is exceeded."""
+
+    __slots__ = (
+        "_db",
+        "_uses",
+        "_budget",
+        "_guilds",
+        "_size",
+        "_loading",
+        "_oversized",
+        "hits",
+        "misses",
+    )
+
+    def __init__(self, db: Database, uses: TagUses, budget: int = 32 * 1024 * 1024) -> None:
+        self._db = db
+        self._uses = uses
+        self._budget = budget
+        # Guilds whose tags don't fit in the budget on their own.
+        self._oversized: set[int] = set()
+        self._guilds: collections.OrderedDict[int, GuildTags] = collections.OrderedDict()
+        # The total size of every cached guild's tags.
+        self._size = 0
+        self._loading: dict[int, asyncio.Future[GuildTags]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, guild_id: int) -> GuildTags:
+        # An empty guild is falsy, but still cached.
+        if (tags := self._guilds.get(guild_id)) is not None:
+            self._guilds.move_to_end(guild_id)
+            self.hits += 1
+            return tags
+
+        self.misses += 1
+
+        if not (loading := self._loading.get(guild_id)):
+            # Only one load per guild, everyone else waits on it.
+            loading = asyncio.ensure_future(self._load(guild_id))
+            loading.add_done_callback(lambda _: self._loading.pop(guild_id, None))
+            self._loading[guild_id] = loading
+
+        return await asyncio.shield(loading)
+
+    async def use(self, guild_id: int, name: str) -> Tag | None:
+        """Resolve a tag by its name or an alias and count a use of
+        it. Guilds too big to keep in the budget are resolved and
+        counted by the database instead of loading them every time."""
+        if guild_id in self._oversized:
+            self.misses += 1
+
+            if not (row := await self._db.fetch_row("tag_use", guild_id, name)):
+                return None
+
+            name, owner, content, uses = row
+            return Tag(name, owner, content, uses + self._uses.pending(guild_id, name))
+
+        if tag := (await self.get(guild_id)).resolve(name):
+            tag.uses += 1
+            self._uses.increment(guild_id, tag.name)
+
+        return tag
+
+    async def _load(self, guild_id: int) -> GuildTags:
+        rows = await self._db.fetch_rows("tag_index_load", guild_id) or []
+        tags = GuildTags(
+            [
+                # Unflushed uses aren't in the db yet.
+                Tag(name, owner, content, uses + self._uses.pending(guild_id, name), aliases)
+                for name, owner, content, uses, aliases in rows
+            ]
+        )
+
+        if (old := self._guilds.pop(guild_id, None)) is not None:
+            # Anyone still holding the old tags can't change our size.
+            self._detach(old)
+
+        if tags.size > self._budget:
+            # Caching it would evict every other guild, and then
+            # itself on the next load.
+            self._oversized.add(guild_id)
+            return tags
+
+        self._oversized.discard(guild_id)
+        self._guilds[guild_id] = tags
+        self._size += tags.size
+        tags.resized = self._resized
+        self._evict()
+        return tags
+
+    def _resized(self, delta: int) -> None:
+        self._size += delta
+
+    def _detach(self, tags: GuildTags) -> None:
+        tags.resized = None
+        self._size -= tags.size
+
+    def _evict(self) -> None:
+        # The most recently loaded guild always stays, even if tags
+        # added since have grown it past the budget.
+        while self._size > self._budget and len(self._guilds) > 1:
+            _, tags = self._guilds.popitem(last=False)
+            self._detach(tags)
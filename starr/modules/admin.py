@@ -95,33 +95,43 @@ async def configure_starboard_cmd(ctx: utils.SlashContext) -> None:
     channel = ctx.options.channel
     guild = ctx.bot.guilds[ctx.guild_id]
 
+    # Every change commits together, on one connection.
+    async with ctx.bot.db.transaction() as tx:
+        if channel:
+            await tx.execute("guild_set_star_channel", channel.id, ctx.guild_id)
+            responses.append(f"Successfully updated starboard channel to <#{channel.id}>.")
+
+        if threshold:
+            await tx.execute("guild_set_threshold", threshold, ctx.guild_id)
+            responses.append(f"Successfully updated starboard star threshold to {threshold}.")
+
+        if whitelist:
+            if whitelist.id in guild.star_blacklist:
+                await tx.execute(
+                    "guild_blacklist_set",
+                    [c for c in guild.star_blacklist if c != whitelist.id],
+                    ctx.guild_id,
+                )
+
+            responses.append(f"Successfully whitelisted <#{whitelist.id}> for starboard activity.")
+
+        if blacklist:
+            await tx.execute("guild_blacklist_append", blacklist.id, ctx.guild_id)
+            responses.append(
+                f"Successfully blacklisted <#{blacklist.id}> from starboard activity."
+            )
+
     if channel:
         guild.star_channel = channel.id
 
-        await ctx.bot.db.execute(
-            "UPDATE guilds SET StarChannel = $1 WHERE GuildID = $2;",
-            channel.id,
-            ctx.guild_id,
-        )
-        responses.append(f"Successfully updated starboard channel to <#{channel.id}>.")
-
     if threshold:
         guild.threshold = threshold
 
-        await ctx.bot.db.execute(
-            "UPDATE guilds SET Threshold = $1 WHERE GuildID = $2;",
-            threshold,
-            ctx.guild_id,
-        )
-        responses.append(f"Successfully updated starboard star threshold to {threshold}.")
-
     if whitelist:
-        await guild.remove_channel_from_blacklist(ctx.bot.db, whitelist.id)
-        responses.append(f"Successfully whitelisted <#{whitelist.id}> for starboard activity.")
+        guild.remove_channel_from_blacklist(whitelist.id)
 
     if blacklist:
-        await guild.add_channel_to_blacklist(ctx.bot.db, blacklist.id)
-        responses.append(f"Successfully blacklisted <#{blacklist.id}> from starboard activity.")
+        guild.add_channel_to_blacklist(blacklist.id)
 
     if responses:
         await ctx.respond("\n".join(responses))
@@ -136,9 +146,7 @@ async def configure_starboard_cmd(ctx: utils.SlashContext) -> None:
 async def configure_prefix_cmd(ctx: utils.SlashContext) -> None:
     value = ctx.options.value
 
-    await ctx.bot.db.execute(
-        "UPDATE guilds SET Prefix = $1 WHERE GuildID = $2;", value, ctx.guild_id
-    )
+    await ctx.bot.db.execute("guild_set_prefix", value, ctx.guild_id)
 
     guild = ctx.bot.guilds[ctx.guild_id]
     guild.prefix = value
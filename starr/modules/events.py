@@ -31,12 +31,17 @@
 
 from __future__ import annotations
 
+import time
+
 import hikari
 import lightbulb
 
+from starr import metrics
 from starr import utils
 
-events = utils.Plugin("events")
+events = utils.Plugin("events", include_datastore=True)
+# When each running command started, by the id of its context.
+events.d.started = {}
 
 
 def embedify(title: str, desc: str) -> hikari.Embed:
@@ -48,9 +53,29 @@ def embedify(title: str, desc: str) -> hikari.Embed:
     )
 
 
+def record_command(context: lightbulb.Context, status: str) -> None:
+    start = events.d.started.pop(id(context), None)
+
+    if start is not None and context.command:
+        metrics.COMMAND_SECONDS.observe(
+            time.perf_counter() - start, context.command.qualname, status
+        )
+
+
+@events.listener(lightbulb.CommandInvocationEvent)
+async def on_command_invocation(event: lightbulb.CommandInvocationEvent) -> None:
+    events.d.started[id(event.context)] = time.perf_counter()
+
+
+@events.listener(lightbulb.CommandCompletionEvent)
+async def on_command_completion(event: lightbulb.CommandCompletionEvent) -> None:
+    record_command(event.context, "ok")
+
+
 @events.listener(lightbulb.CommandErrorEvent)
 async def on_command_error(event: lightbulb.CommandErrorEvent) -> None:
     e = event.exception
+    record_command(event.context, "error")
 
     if isinstance(e, lightbulb.CommandNotFound):
         # Suppress command not found (how annoying)
@@ -52,15 +52,19 @@ async def ping_command(ctx: utils.PrefixContext) -> None:
     await ctx.respond("wait what...")
     elapsed = time.perf_counter() - start
 
+    lag = ctx.bot.loop_monitor
     await ctx.edit_last_response(
-        f"Gateway: {ctx.bot.heartbeat_latency * 1000:,.0f} ms\nRest: {elapsed * 1000:,.0f} ms"
+        f"Gateway: {ctx.bot.heartbeat_latency * 1000:,.0f} ms\n"
+        f"Rest: {elapsed * 1000:,.0f} ms\n"
+        f"Loop lag: {lag.percentile(50) * 1000:,.1f} ms p50, "
+        f"{lag.percentile(99) * 1000:,.1f} ms p99, {lag.max * 1000:,.1f} ms max"
     )
 
 
 @meta.command
 @lightbulb.set_help(docstring=True)
 @lightbulb.option("user", "The user to get info on.", type=hikari.Member)
-@lightbulb.command("userinfo", "Get information about a user.")
+@lightbulb.command("userinfo", "Get information about a user.", parser=utils.Parser)
 @lightbulb.implements(lightbulb.PrefixCommand, lightbulb.SlashCommand)
 async def user_info_cmd(ctx: utils.Context) -> None:
     """For when you feel like being a stalker."""
@@ -106,5 +110,29 @@ async def user_info_cmd(ctx: utils.Context) -> None:
     await ctx.respond(e)
 
 
+@meta.command
+@lightbulb.set_help(docstring=True)
+@lightbulb.add_checks(lightbulb.owner_only)
+@lightbulb.option("count", "How many statements to show.", type=int, default=10)
+@lightbulb.command("queries", "The slowest database statements.")
+@lightbulb.implements(lightbulb.PrefixCommand)
+async def queries_command(ctx: utils.PrefixContext) -> None:
+    """Where all the time goes, by total time spent executing."""
+    if not (top := ctx.bot.db.query_stats.top(ctx.options.count)):
+        await ctx.respond("No queries yet.")
+        return None
+
+    lines = [f"{'calls':>7} {'total':>9} {'mean':>7} {'max':>7} {'wait':>7}  statement"]
+    for statement, stat in top:
+        lines.append(
+            f"{stat.calls:>7,} {stat.total:>8.2f}s {stat.mean * 1000:>5.1f}ms "
+            f"{stat.max * 1000:>5.0f}ms {stat.acquire / stat.calls * 1000:>5.1f}ms  "
+            f"{statement[:60]}"
+        )
+
+    table = "\n".join(lines)[:1990]
+    await ctx.respond(f"```\n{table}\n```")
+
+
 def load(bot: StarrBot) -> None:
     bot.add_plugin(meta)
@@ -0,0 +1,205 @@
+# Copyright (c) 2021-present, Jonxslays
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the
+#    distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from __future__ import annotations
+
+import asyncio
+import datetime
+import logging
+
+import hikari
+
+from starr import utils
+from starr.bot import StarrBot
+from starr.concurrency import RateLimiter
+from starr.models import StarboardMessage
+from starr.models import StarrGuild
+from starr.modules.stars import count_stars
+from starr.modules.stars import stars
+
+reconcile = utils.Plugin("reconcile", "Repairs the starboard.", include_datastore=True)
+# Stays well clear of the rate limits events need.
+reconcile.d.budget = RateLimiter(30, 60)
+# Every run looks back over this much history, plus any time the
+# bot was down, up to the max.
+reconcile.d.lookback = datetime.timedelta(days=1)
+reconcile.d.max_lookback = datetime.timedelta(days=7)
+reconcile.d.interval = 6 * 60 * 60
+reconcile.d.task = None
+
+_log = logging.getLogger(__name__)
+
+
+def snowflake(when: datetime.datetime) -> int:
+    return int(hikari.Snowflake.from_datetime(when))
+
+
+async def reconcile_message(
+    bot: StarrBot,
+    guild: StarrGuild,
+    message: hikari.Message,
+    count: int,
+) -> None:
+    async with stars.d.locks[message.id]:
+        starboard_message = await StarboardMessage.from_reference(bot.db, message.id, guild)
+
+        if count >= guild.threshold and not starboard_message:
+            await reconcile.d.budget.acquire()
+            await StarboardMessage.create_new(
+                bot.rest, bot.db, bot.channel_names, message, count, guild
+            )
+
+        elif count < guild.threshold and starboard_message:
+            await reconcile.d.budget.acquire()
+            stars.d.edits.cancel(message.id)
+            await starboard_message.delete(bot.rest, bot.db)
+
+        elif starboard_message:
+            await reconcile.d.budget.acquire()
+
+            if not await starboard_message.update(bot.rest, count, guild):
+                await starboard_message.repost(
+                    bot.rest, bot.db, bot.channel_names, message, count, guild
+                )
+
+
+async def reconcile_batch(
+    bot: StarrBot,
+    guild: StarrGuild,
+    channel_id: int,
+    after: int,
+    messages: list[hikari.Message],
+) -> None:
+    rows = await bot.db.fetch_rows("starboard_select_batch", [m.id for m in messages], channel_id)
+    on_board: dict[int, int] = {r: s for r, s in rows or ()}
+
+    for reference_id, star_message_id in on_board.items():
+        StarboardMessage.references[reference_id] = star_message_id
+
+    # Anything else on the board from this stretch of the channel had
+    # its original deleted while we weren't looking.
+    rows = await bot.db.fetch_rows("starboard_select_range", channel_id, after, messages[-1].id)
+
+    for reference_id, star_message_id in rows or ():
+        if reference_id in on_board:
+            continue
+
+        async with stars.d.locks[reference_id]:
+            await reconcile.d.budget.acquire()
+            await StarboardMessage(star_message_id, reference_id, guild).delete(bot.rest, bot.db)
+
+    for message in messages:
+        count = stars.d.counts.sync(message.id, count_stars(message))
+
+        if count < guild.threshold and message.id not in on_board:
+            continue
+
+        if message.id not in on_board:
+            StarboardMessage.references[message.id] = None
+
+        await reconcile_message(bot, guild, message, count)
+
+
+async def reconcile_channel(
+    bot: StarrBot, guild: StarrGuild, channel_id: int, floor: int, oldest: int
+) -> None:
+    checkpoint = await bot.db.fetch_one("checkpoint_select", channel_id)
+    cursor = max(checkpoint or floor, oldest)
+
+    while True:
+        await reconcile.d.budget.acquire()
+
+        try:
+            messages = list(await bot.rest.fetch_messages(channel_id, after=cursor).limit(100))
+        except (hikari.ForbiddenError, hikari.NotFoundError):
+            # We can't see this channel anymore.
+            return None
+
+        if not messages:
+            break
+
+        await reconcile_batch(bot, guild, channel_id, cursor, messages)
+        cursor = messages[-1].id
+
+        # A restart picks up from the last batch.
+        await bot.db.execute("checkpoint_set", channel_id, cursor)
+
+    # Finished, so the next run covers the window again, along with
+    # anything that happened while the bot was down in between.
+    await bot.db.execute("checkpoint_set", channel_id, floor)
+
+
+async def reconcile_guild(bot: StarrBot, guild: StarrGuild, floor: int, oldest: int) -> None:
+    for channel in bot.cache.get_guild_channels_view_for_guild(guild.guild_id).values():
+        if (
+            channel.type not in (hikari.ChannelType.GUILD_TEXT, hikari.ChannelType.GUILD_NEWS)
+            or channel.id == guild.star_channel
+            or channel.id in guild.star_blacklist
+        ):
+            continue
+
+        await reconcile_channel(bot, guild, channel.id, floor, oldest)
+
+
+async def run_reconciliation(bot: StarrBot) -> None:
+    while True:
+        # Give the guilds a chance to come in first.
+        await asyncio.sleep(60)
+        now = utils.now()
+        floor = snowflake(now - reconcile.d.lookback)
+        oldest = snowflake(now - reconcile.d.max_lookback)
+
+        for guild in [*bot.guilds.values()]:
+            if not guild.star_channel:
+                continue
+
+            try:
+                await reconcile_guild(bot, guild, floor, oldest)
+            except Exception:
+                _log.exception("Failed to reconcile the starboard for %s", guild.guild_id)
+
+        _log.info("Reconciled starboards in %s", utils.now() - now)
+        await asyncio.sleep(reconcile.d.interval - 60)
+
+
+@reconcile.listener(hikari.StartedEvent)
+async def on_started(_: hikari.StartedEvent) -> None:
+    reconcile.d.task = asyncio.create_task(run_reconciliation(reconcile.bot))
+
+
+@reconcile.listener(hikari.StoppingEvent)
+async def on_stopping(_: hikari.StoppingEvent) -> None:
+    if reconcile.d.task:
+        reconcile.d.task.cancel()
+
+
+def load(bot: StarrBot) -> None:
+    bot.add_plugin(reconcile)
@@ -31,21 +31,54 @@
 
 from __future__ import annotations
 
+import functools
+import typing as t
+
 import hikari
 
+from starr import metrics
 from starr import utils
 from starr.bot import StarrBot
+from starr.cache import StarCounts
+from starr.concurrency import Debouncer
+from starr.concurrency import GuildQueues
+from starr.concurrency import KeyedLock
 from starr.models import StarboardMessage
 from starr.models import StarrGuild
 
 stars = utils.Plugin("stars", "Starboard related plugin.", include_datastore=True)
 stars.d.star = "\u2B50"
+stars.d.counts = StarCounts()
+# Bursts of stars on one message become a single edit.
+stars.d.edits = Debouncer[int](window=2, max_delay=10)
+stars.d.locks = KeyedLock[int]()
+# Starboard work runs fairly between guilds, one guild's
+# reaction storm only slows down that guild.
+stars.d.queues = GuildQueues[tuple[int, str]](workers=16, maxsize=100, per_guild=2)
+# Only this many guilds get their own queue metrics.
+stars.d.busiest = 10
+
 
+def count_stars(message: hikari.Message) -> int:
+    # The total number of star emojis.
+    return sum(map(lambda r: r.count if r.emoji == stars.d.star else 0, message.reactions))
 
-async def get_reaction_event_info(
+
+async def fetch_message(
     event: hikari.GuildReactionAddEvent | hikari.GuildReactionDeleteEvent,
     bot: StarrBot,
-) -> tuple[hikari.Message, StarrGuild, int] | None:
+) -> hikari.Message | None:
+    try:
+        return await bot.rest.fetch_message(event.channel_id, event.message_id)
+    except hikari.NotFoundError:
+        # The message got deleted.
+        return None
+
+
+async def get_starboard_guild(
+    event: hikari.GuildReactionAddEvent | hikari.GuildReactionDeleteEvent,
+    bot: StarrBot,
+) -> StarrGuild | None:
     if event.emoji_name != stars.d.star:
         # Ignore non star emojis
         return None
@@ -60,73 +93,191 @@ async def get_reaction_event_info(
         # or this channel is in their starboard blacklist.
         return None
 
-    try:
-        message = await bot.rest.fetch_message(event.channel_id, event.message_id)
-        # We could ignore reactions from the messages author, but this
-        # is inconsistent because during discord outages, or bot
-        # downtime we can never be sure again who it was that reacted.
-        # On top of this, when the next person reacts, the authors
-        # reaction will get counted.
-    except hikari.NotFoundError:
-        # The message got deleted.
+    return guild
+
+
+async def get_star_count(
+    event: hikari.GuildReactionAddEvent | hikari.GuildReactionDeleteEvent,
+    count: int | None,
+) -> tuple[int, hikari.Message | None] | None:
+    if count is not None:
+        # We have an up to date count for this message already.
+        return count, None
+
+    if not (message := await fetch_message(event, stars.bot)):
         return None
 
-    # The total number of star emojis.
-    count = sum(map(lambda r: r.count if r.emoji == stars.d.star else 0, message.reactions))
+    # We could ignore reactions from the messages author, but this
+    # is inconsistent because during discord outages, or bot
+    # downtime we can never be sure again who it was that reacted.
+    # On top of this, when the next person reacts, the authors
+    # reaction will get counted.
+    return stars.d.counts.sync(message.id, count_stars(message)), message
+
+
+async def update_starboard_message(
+    event: hikari.GuildReactionAddEvent | hikari.GuildReactionDeleteEvent,
+    message: hikari.Message | None,
+    count: int,
+    guild: StarrGuild,
+) -> None:
+    async with stars.d.locks[event.message_id]:
+        starboard_message = await StarboardMessage.from_reference(
+            stars.bot.db, event.message_id, guild
+        )
+
+        if not starboard_message:
+            # It was taken off the starboard while this edit waited.
+            return None
+
+        if await starboard_message.update(stars.bot.rest, count, guild):
+            return None
+
+        # The starboard message was deleted, so post it again.
+        if message := message or await fetch_message(event, stars.bot):
+            await starboard_message.repost(
+                stars.bot.rest, stars.bot.db, stars.bot.channel_names, message, count, guild
+            )
 
-    return message, guild, count
+
+def submit_update(
+    event: hikari.GuildReactionAddEvent | hikari.GuildReactionDeleteEvent,
+    message: hikari.Message | None,
+    count: int,
+    guild: StarrGuild,
+) -> None:
+    stars.d.edits.submit(
+        event.message_id,
+        functools.partial(update_starboard_message, event, message, count, guild),
+    )
+
+
+def queue_reaction(
+    event: hikari.GuildReactionAddEvent | hikari.GuildReactionDeleteEvent,
+    handler: t.Callable[..., t.Awaitable[None]],
+    guild: StarrGuild,
+    delta: int,
+) -> None:
+    # The count has to see every event, but the starboard only cares
+    # about the latest one, so queued work for a message is replaced
+    # by newer work for the same message.
+    count = stars.d.counts.add(event.message_id, delta)
+    stars.d.queues.submit(
+        event.guild_id,
+        (event.message_id, "stars"),
+        functools.partial(handler, event, guild, count),
+    )
 
 
 @stars.listener(hikari.GuildReactionAddEvent)
 async def on_reaction_add(
     event: hikari.GuildReactionAddEvent,
 ) -> None:
-    if not (event_data := await get_reaction_event_info(event, stars.bot)):
+    if not (guild := await get_starboard_guild(event, stars.bot)):
         # If this returns None we don't care about the event.
         return None
 
-    message, guild, count = event_data
-    if message.channel_id == guild.star_channel:
+    if event.channel_id == guild.star_channel:
         return None
 
-    if count >= guild.threshold:
-        # This message is a star!
-        starboard_message = await StarboardMessage.from_reference(stars.bot.db, message.id, guild)
+    queue_reaction(event, handle_star_added, guild, 1)
 
-        if not starboard_message:
-            # This is a brand new starboard entry.
-            await StarboardMessage.create_new(stars.bot.rest, stars.bot.db, message, count, guild)
 
-        else:
+async def handle_star_added(
+    event: hikari.GuildReactionAddEvent, guild: StarrGuild, count: int | None
+) -> None:
+    if not (star_count := await get_star_count(event, count)):
+        return None
+
+    count, message = star_count
+    if count < guild.threshold:
+        return None
+
+    # This message is a star! Only one event per message gets to
+    # check and change its starboard entry at a time, otherwise
+    # a burst of stars could create it more than once.
+    async with stars.d.locks[event.message_id]:
+        starboard_message = await StarboardMessage.from_reference(
+            stars.bot.db, event.message_id, guild
+        )
+
+        if starboard_message:
             # This is an existing starboard entry.
-            await starboard_message.update(stars.bot.rest, stars.bot.db, message, count, guild)
+            return submit_update(event, message, count, guild)
+
+        # This is a brand new starboard entry.
+        if message := message or await fetch_message(event, stars.bot):
+            await StarboardMessage.create_new(
+                stars.bot.rest, stars.bot.db, stars.bot.channel_names, message, count, guild
+            )
 
 
 @stars.listener(hikari.GuildReactionDeleteEvent)
 async def on_reaction_delete(event: hikari.GuildReactionDeleteEvent) -> None:
-    if not (event_data := await get_reaction_event_info(event, stars.bot)):
+    if not (guild := await get_starboard_guild(event, stars.bot)):
         # If this returns None we don't care about the event.
         return None
 
-    message, guild, count = event_data
-    starboard_message = await StarboardMessage.from_reference(stars.bot.db, message.id, guild)
+    queue_reaction(event, handle_star_removed, guild, -1)
+
 
-    if not starboard_message:
-        # This message is not in the database and thus we can ignore it.
+async def handle_star_removed(
+    event: hikari.GuildReactionDeleteEvent, guild: StarrGuild, count: int | None
+) -> None:
+    if not (star_count := await get_star_count(event, count)):
         return None
 
-    if count < guild.threshold:
-        # This message is no longer a star.
-        await starboard_message.delete(stars.bot.rest, stars.bot.db)
+    count, message = star_count
 
-    else:
-        # This is an existing starboard entry, and still a star!
-        await starboard_message.update(stars.bot.rest, stars.bot.db, message, count, guild)
+    async with stars.d.locks[event.message_id]:
+        starboard_message = await StarboardMessage.from_reference(
+            stars.bot.db, event.message_id, guild
+        )
+
+        if not starboard_message:
+            # This message is not in the database and thus we can
+            # ignore it.
+            return None
+
+        if count < guild.threshold:
+            # This message is no longer a star, so any edits still
+            # waiting to happen are dropped.
+            stars.d.edits.cancel(event.message_id)
+            await starboard_message.delete(stars.bot.rest, stars.bot.db)
+
+        else:
+            # This is an existing starboard entry, and still a star!
+            submit_update(event, message, count, guild)
 
 
 @stars.listener(hikari.GuildMessageDeleteEvent)
 @stars.listener(hikari.GuildReactionDeleteEmojiEvent)
 @stars.listener(hikari.GuildReactionDeleteAllEvent)
+async def on_guaranteed_delete(
+    event: hikari.GuildMessageDeleteEvent
+    | hikari.GuildReactionDeleteEmojiEvent
+    | hikari.GuildReactionDeleteAllEvent,
+) -> None:
+    if (
+        isinstance(event, hikari.GuildReactionDeleteEmojiEvent)
+        and event.emoji_name != stars.d.star
+    ):
+        # Clearing some other emoji leaves the stars alone, the
+        # gateway doesn't forward these to bus workers either.
+        return None
+
+    if isinstance(event, hikari.GuildMessageDeleteEvent):
+        stars.d.counts.forget(event.message_id)
+    else:
+        stars.d.counts.sync(event.message_id, 0)
+
+    stars.d.queues.submit(
+        event.guild_id,
+        (event.message_id, "delete"),
+        functools.partial(handle_guaranteed_delete, event),
+    )
+
+
 async def handle_guaranteed_delete(
     event: hikari.GuildMessageDeleteEvent
     | hikari.GuildReactionDeleteEmojiEvent
@@ -141,11 +292,70 @@ async def handle_guaranteed_delete(
         # The guild hasn't configured their starboard yet.
         return None
 
-    message = await StarboardMessage.from_reference(stars.bot.db, event.message_id, guild)
+    async with stars.d.locks[event.message_id]:
+        message = await StarboardMessage.from_reference(stars.bot.db, event.message_id, guild)
+
+        if not message:
+            return None
+
+        # Delete message from db and starboard, it has no more
+        # reactions.
+        stars.d.edits.cancel(event.message_id)
+        await message.delete(stars.bot.rest, stars.bot.db)
+
+
+@stars.listener(hikari.StoppingEvent)
+async def on_stopping(_: hikari.StoppingEvent) -> None:
+    # Let queued and running work finish, so nothing is left half
+    # posted, before the database closes.
+    await stars.d.queues.close()
+    await stars.d.edits.close()
+
+
+def queue_samples() -> list[metrics.Sample]:
+    depths = stars.d.queues.depths().values()
+    return [
+        ("", {"state": "queued"}, sum(depths)),
+        ("", {"state": "guilds"}, sum(1 for d in depths if d)),
+        ("", {"state": "debounced"}, len(stars.d.edits)),
+    ]
+
+
+def guild_queue_samples() -> list[metrics.Sample]:
+    return [
+        ("", {"guild": str(guild_id)}, depth)
+        for guild_id, depth, _ in stars.d.queues.busiest(stars.d.busiest)
+    ]
+
 
-    # Delete message from db and starboard, it has no more reactions.
-    return await message.delete(stars.bot.rest, stars.bot.db) if message else None
+def guild_wait_samples() -> list[metrics.Sample]:
+    return [
+        ("", {"guild": str(guild_id)}, wait)
+        for guild_id, _, wait in stars.d.queues.busiest(stars.d.busiest)
+    ]
 
 
 def load(bot: StarrBot) -> None:
     bot.add_plugin(stars)
+    stars.d.queues.start()
+    metrics.registry.collector(
+        "starr_starboard_queue", "Starboard work waiting to run.", "gauge", queue_samples
+    )
+    metrics.registry.collector(
+        "starr_starboard_guild_queue",
+        "Starboard work waiting in the busiest guilds.",
+        "gauge",
+        guild_queue_samples,
+    )
+    metrics.registry.collector(
+        "starr_starboard_guild_wait_seconds",
+        "How long the oldest starboard work in the busiest guilds has waited.",
+        "gauge",
+        guild_wait_samples,
+    )
+    metrics.registry.collector(
+        "starr_starboard_dropped_total",
+        "Starboard work dropped from full queues.",
+        "counter",
+        lambda: [("", {}, sum(stars.d.queues.dropped.values()))],
+    )
@@ -31,10 +31,15 @@
 
 from __future__ import annotations
 
+import typing as t
+
 import hikari
 import lightbulb
 
 from starr import utils
+from starr.bot import StarrBot
+from starr.db import Database
+from starr.models import Tag
 
 RESERVED_TAGS = (
     "create",
@@ -50,6 +55,13 @@ RESERVED_TAGS = (
 tags = utils.Plugin("tags", "Tag related commands.")
 
 
+async def delete_tag(db: Database, guild_id: int, name: str) -> None:
+    # The aliases reference the tag, so they have to go first.
+    async with db.transaction() as tx:
+        await tx.execute("tag_aliases_delete", guild_id, name)
+        await tx.execute("tag_delete", guild_id, name)
+
+
 @tags.command
 @lightbulb.set_help(docstring=True)
 @lightbulb.option(
@@ -64,16 +76,9 @@ async def tag_group(ctx: utils.PrefixContext) -> None:
         <name|subcommand>: The tag or subcommand to invoke.
     """
     name = ctx.options.name.lower()
-    query = (
-        "UPDATE tags SET uses = uses + 1 "
-        "FROM tag_aliases a WHERE tags.guildid = $1 "
-        "AND tags.tagname = $2 "
-        "OR (a.tagalias = $2 AND tags.tagname = a.tagname) "
-        "RETURNING tags.tagcontent;"
-    )
 
-    if content := await ctx.bot.db.fetch_one(query, ctx.guild_id, name):
-        await ctx.respond(content)
+    if tag := await ctx.bot.tag_index.use(ctx.guild_id, name):
+        await ctx.respond(tag.content)
         return None
 
     await ctx.respond(f"`{ctx.options.name}` is not a valid tag.")
@@ -91,69 +96,90 @@ async def tag_info_command(ctx: utils.PrefixContext) -> None:
         <name|alias>: The tag name or alias to get info about.
     """
     name = ctx.options.name.lower()
-    query = (
-        "SELECT t.tagname, t.tagowner, t.uses "
-        "FROM tags t FULL OUTER JOIN tag_aliases a "
-        "ON t.tagname = a.tagname AND t.guildid = a.guildid "
-        "WHERE t.guildid = $2 AND (t.tagname = $1 OR a.tagalias = $1) "
-        "LIMIT 1;"
-    )
+    guild_tags = await ctx.bot.tag_index.get(ctx.guild_id)
 
-    if not (tag_data := await ctx.bot.db.fetch_rows(query, name, ctx.guild_id)):
+    if not (tag := guild_tags.resolve(name)):
         await ctx.respond(f"No `{name}` tag exists.")
         return None
 
-    new_name, owner, uses = tag_data[0]
     await ctx.respond(
         hikari.Embed(
             title=f"Tag information",
-            description=f"Requested: `{name}` \nTag name: `{new_name}`",
+            description=f"Requested: `{name}` \nTag name: `{tag.name}`",
             color=hikari.Color(0x19FA3B),
         )
-        .add_field("Owner", f"<@{owner}>", inline=True)
-        .add_field("Uses", uses, inline=True)
-        .add_field("Is alias", str(new_name != name), inline=True)
+        .add_field("Owner", f"<@{tag.owner}>", inline=True)
+        .add_field("Uses", str(tag.uses), inline=True)
+        .add_field("Is alias", str(tag.name != name), inline=True)
+    )
+
+
+def tag_field(row: t.Iterable[t.Any]) -> tuple[str, ...]:
+    name, owner, uses = row
+    return (name, f"Tag Owner: <@{owner}>\nTag Uses: {uses}")
+
+
+def tag_cursor(field: tuple[str, ...]) -> tuple[int, str]:
+    # The uses and name a tag field was made from.
+    return (int(field[1].rsplit(" ", 1)[1]), field[0])
+
+
+@utils.stateless_source("tags")
+def tag_pages(bot: StarrBot, guild_id: hikari.Snowflake, user_id: str) -> utils.PageSource:
+    # All of the guild's tags, or only those owned by `user_id`.
+    query = "tag_list"
+    values: tuple[int, ...] = (guild_id,)
+
+    if user_id:
+        query = "tag_list_by_owner"
+        values = (guild_id, int(user_id))
+
+    return utils.QuerySource(
+        bot.db,
+        query,
+        f"{query}_reverse",
+        *values,
+        format=tag_field,
+        key=tag_cursor,
+        # Uses are never negative, and fit in a BIGINT.
+        start=(2**63 - 1, ""),
+        end=(-1, ""),
     )
 
 
 @tag_group.child
 @lightbulb.set_help(docstring=True)
 @lightbulb.option("user", "The optional user to list tags for.", type=hikari.User, default=None)
-@lightbulb.command("list", "List tags from a user, or the guild.")
+@lightbulb.command("list", "List tags from a user, or the guild.", parser=utils.Parser)
 @lightbulb.implements(lightbulb.PrefixSubCommand)
 async def tag_list_command(ctx: utils.PrefixContext) -> None:
     """List tags from a user, or the guild."""
 
     if ctx.options.user is not None:
-        query = (
-            "SELECT tagname, tagowner, uses FROM tags "
-            "WHERE guildid = $1 AND tagowner = $2 "
-            "ORDER BY uses DESC;"
-        )
-        tags = await ctx.bot.db.fetch_rows(query, ctx.guild_id, ctx.options.user.id)
+        user_id = str(ctx.options.user.id)
+        total = await ctx.bot.db.fetch_one("tag_count_by_owner", ctx.guild_id, ctx.options.user.id)
         tags_for = str(ctx.options.user)
     else:
-        query = "SELECT tagname, tagowner, uses FROM tags WHERE guildid = $1 ORDER BY uses DESC;"
-        tags = await ctx.bot.db.fetch_rows(query, ctx.guild_id)
+        user_id = ""
+        total = await ctx.bot.db.fetch_one("tag_count", ctx.guild_id)
         guild = ctx.get_guild()
         tags_for = guild.name if guild else "this guild"
 
     # If there are no tags stored
-    if tags is None:
+    if not total:
         await ctx.respond(f"No tags for {tags_for} yet.")
         return None
 
-    fields: list[tuple[str, ...]] = []
-
-    for tag in tags:
-        fields.append((tag[0], f"Tag Owner: <@{tag[1]}>\nTag Uses: {tag[2]}"))
-
+    # Each page is loaded when it's shown, the guild could have
+    # thousands of tags. The buttons keep working across restarts.
     pag = utils.Paginator(
         ctx,
         title=f"Tags for {tags_for}",
         description="",
         per_page=5,
-        fields=fields,
+        source=tag_pages(ctx.bot, ctx.guild_id, user_id),
+        total=total,
+        key=f"tags:{user_id}",
     )
     await pag.paginate(60)
 
@@ -181,40 +207,27 @@ async def tag_alias_command(ctx: utils.PrefixContext) -> None:
         )
         return None
 
-    if not (
-        owner := await ctx.bot.db.fetch_one(
-            "SELECT tagowner FROM tags WHERE guildid = $1 AND tagname = $2;", ctx.guild_id, name
-        )
-    ):
+    guild_tags = await ctx.bot.tag_index.get(ctx.guild_id)
+
+    if not (tag := guild_tags.get(name)):
         # Probly a typo eh?
         await ctx.respond(f"Can't alias tag `{name}` because it does not exist, typo?.")
         return None
 
-    if not ctx.author.id == owner:
+    if not ctx.author.id == tag.owner:
         # The user doesn't own the tag, yikes
-        await ctx.respond(f"<@{owner}> owns the `{name}` tag, so you can't alias it.")
+        await ctx.respond(f"<@{tag.owner}> owns the `{name}` tag, so you can't alias it.")
         return None
 
     # They own the `name` tag, but does anyone have the alias
-    if alias_owner := await ctx.bot.db.fetch_row(
-        "SELECT t.tagowner FROM tags t FULL OUTER JOIN tag_aliases a "
-        "ON t.tagname = a.tagname AND t.guildid = a.guildid "
-        "WHERE t.guildid = $1 AND (t.tagname = $2 OR a.tagalias = $2)"
-        "LIMIT 1;",
-        ctx.guild_id,
-        alias,
-    ):
+    if alias_tag := guild_tags.resolve(alias):
         # The alias is already in use, so we bail
-        await ctx.respond(f"Sorry, `{alias}` is already in use by <@{alias_owner[0]}>.")
+        await ctx.respond(f"Sorry, `{alias}` is already in use by <@{alias_tag.owner}>.")
         return None
 
     # Create the alias
-    await ctx.bot.db.fetch_one(
-        "INSERT INTO tag_aliases (tagname, tagalias, guildid) VALUES ($1, $2, $3);",
-        name,
-        alias,
-        ctx.guild_id,
-    )
+    await ctx.bot.db.execute("tag_alias_insert", name, alias, ctx.guild_id)
+    guild_tags.add_alias(tag, alias)
     await ctx.respond(f"Successfully aliased `{name}` to `{alias}`.")
     return None
 
@@ -231,23 +244,23 @@ async def tag_claim_command(ctx: utils.PrefixContext) -> None:
         <name>: The name of the tag to claim.
     """
     name = ctx.options.name.lower()
-    select = "SELECT tagowner FROM tags WHERE guildid = $1 AND tagname = $2;"
-    transfer = "UPDATE tags SET tagowner = $1 WHERE guildid = $2 AND tagname = $3;"
+    guild_tags = await ctx.bot.tag_index.get(ctx.guild_id)
 
-    if not (owner := await ctx.bot.db.fetch_one(select, ctx.guild_id, name)):
+    if not (tag := guild_tags.get(name)):
         await ctx.respond(f"There is no tag named `{name}`, make it if you want it...")
         return None
 
     try:
-        await ctx.bot.rest.fetch_member(ctx.guild_id, owner)
+        await ctx.bot.rest.fetch_member(ctx.guild_id, tag.owner)
     except hikari.NotFoundError:
         # If we can't find the member, they aren't in the server
-        await ctx.bot.db.execute(transfer, ctx.author.id, ctx.guild_id, name)
+        await ctx.bot.db.execute("tag_set_owner", ctx.author.id, ctx.guild_id, name)
+        tag.owner = ctx.author.id
         await ctx.respond(f"Congrats, you own the `{name}` tag now!")
         return None
 
     # The tag owner is still in the server
-    await ctx.respond(f"You can't have the `{name}` tag, <@{owner}> is still here!")
+    await ctx.respond(f"You can't have the `{name}` tag, <@{tag.owner}> is still here!")
 
 
 @tag_group.child
@@ -265,13 +278,6 @@ async def tag_create_command(ctx: utils.PrefixContext) -> None:
     """
     name = ctx.options.name.lower()
     content = ctx.options.content
-    query = (
-        "UPDATE tags SET uses = uses + 1 "
-        "FROM tag_aliases a WHERE tags.guildid = $1 "
-        "AND tags.tagname = $2 "
-        "OR (a.tagalias = $2 AND tags.tagname = a.tagname) "
-        "RETURNING tags.tagowner;"
-    )
 
     # Can't create a reserved tag
     if any(name.startswith(r) for r in RESERVED_TAGS):
@@ -281,21 +287,20 @@ async def tag_create_command(ctx: utils.PrefixContext) -> None:
         )
         return None
 
+    guild_tags = await ctx.bot.tag_index.get(ctx.guild_id)
+
     # If they try to make an existing tag, yeah thats a use :kek:
-    if owner := await ctx.bot.db.fetch_one(query, ctx.guild_id, name):
+    if tag := guild_tags.resolve(name):
+        tag.uses += 1
+        ctx.bot.tag_uses.increment(ctx.guild_id, tag.name)
         await ctx.respond(
-            f"Sorry, `{name}` was already created by <@{owner}>. Try a different tag name.",
+            f"Sorry, `{name}` was already created by <@{tag.owner}>. Try a different tag name.",
         )
         return None
 
     # A successful tag creation
-    await ctx.bot.db.execute(
-        "INSERT INTO tags (GuildID, TagOwner, TagName, TagContent) VALUES ($1, $2, $3, $4);",
-        ctx.guild_id,
-        ctx.author.id,
-        name,
-        content,
-    )
+    await ctx.bot.db.execute("tag_insert", ctx.guild_id, ctx.author.id, name, content)
+    guild_tags.add(Tag(name, ctx.author.id, content))
 
     await ctx.respond(f"`{name}` tag created by <@{ctx.author.id}>.")
 
@@ -317,27 +322,18 @@ async def tag_edit_command(ctx: utils.PrefixContext) -> None:
     """
     name = ctx.options.name.lower()
     content = ctx.options.content
-    query = (
-        "SELECT t.tagowner FROM tags t FULL OUTER JOIN tag_aliases a "
-        "ON t.tagname = a.tagname AND t.guildid = a.guildid "
-        "WHERE t.guildid = $2 AND (t.tagname = $1 OR a.tagalias = $1) "
-        "LIMIT 1;"
-    )
+    guild_tags = await ctx.bot.tag_index.get(ctx.guild_id)
 
-    if owner := await ctx.bot.db.fetch_one(query, name, ctx.guild_id):
+    if tag := guild_tags.resolve(name):
         # A successful tag edit
-        if owner == ctx.author.id:
-            await ctx.bot.db.execute(
-                "UPDATE tags SET tagcontent = $1 WHERE tagname = $2 AND guildid = $3;",
-                content,
-                name,
-                ctx.guild_id,
-            )
+        if tag.owner == ctx.author.id:
+            await ctx.bot.db.execute("tag_set_content", content, tag.name, ctx.guild_id)
+            guild_tags.edit(tag, content)
             await ctx.respond(f"`{name}` tag edited by {ctx.author.mention}.")
             return None
 
         # Author doesn't own the tag
-        await ctx.respond(f"<@{owner}> owns the `{name}` tag, you cannot edit it.")
+        await ctx.respond(f"<@{tag.owner}> owns the `{name}` tag, you cannot edit it.")
         return None
 
     # There is no tag with that name, do they want to make one?
@@ -375,14 +371,8 @@ async def tag_edit_command(ctx: utils.PrefixContext) -> None:
             assert isinstance(event.interaction, hikari.ComponentInteraction)
 
             if event.interaction.custom_id == "yes":
-                await ctx.bot.db.execute(
-                    "INSERT INTO tags (GuildID, TagOwner, TagName, TagContent) "
-                    "VALUES ($1, $2, $3, $4);",
-                    ctx.guild_id,
-                    ctx.author.id,
-                    name,
-                    content,
-                )
+                await ctx.bot.db.execute("tag_insert", ctx.guild_id, ctx.author.id, name, content)
+                guild_tags.add(Tag(name, ctx.author.id, content))
                 await ctx.edit_last_response(
                     f"`{name}` tag created by {ctx.author.mention}.",
                     components=[],
@@ -400,7 +390,7 @@ async def tag_edit_command(ctx: utils.PrefixContext) -> None:
 @lightbulb.set_help(docstring=True)
 @lightbulb.option("user", "The name/ID of the user to transfer to.", type=hikari.User)
 @lightbulb.option("name", "The name of the tag.")
-@lightbulb.command("transfer", "Transfer a tag to another user.")
+@lightbulb.command("transfer", "Transfer a tag to another user.", parser=utils.Parser)
 @lightbulb.implements(lightbulb.PrefixSubCommand)
 async def tag_transfer_command(ctx: utils.PrefixContext) -> None:
     """Transfer a tag to someone else.
@@ -416,25 +406,18 @@ async def tag_transfer_command(ctx: utils.PrefixContext) -> None:
     """
     name = ctx.options.name.lower()
     user = ctx.options.user
+    guild_tags = await ctx.bot.tag_index.get(ctx.guild_id)
 
-    if owner := await ctx.bot.db.fetch_one(
-        "SELECT TagOwner FROM tags WHERE GuildID = $1 AND TagName = $2;",
-        ctx.guild_id,
-        name,
-    ):
+    if tag := guild_tags.get(name):
         # A successful transfer
-        if owner == ctx.author.id:
-            await ctx.bot.db.execute(
-                "UPDATE tags SET TagOwner = $1 WHERE GuildID = $2 AND TagName = $3;",
-                user.id,
-                ctx.guild_id,
-                name,
-            )
+        if tag.owner == ctx.author.id:
+            await ctx.bot.db.execute("tag_set_owner", user.id, ctx.guild_id, name)
+            tag.owner = user.id
             await ctx.respond(f"`{name}` tag transferred from <@{ctx.author.id}> to <@{user.id}>.")
             return None
 
         # Can't transfer a tag they don't own
-        await ctx.respond(f"<@{owner}> owns the `{name}` tag, you cannot transfer it.")
+        await ctx.respond(f"<@{tag.owner}> owns the `{name}` tag, you cannot transfer it.")
         return None
 
     # Can't transfer a tag that doesn't exist
@@ -453,38 +436,35 @@ async def tag_delete_command(ctx: utils.PrefixContext) -> None:
         <name>: The tag to delete.
     """
     name = ctx.options.name.lower()
-    select = "SELECT tagowner FROM tags WHERE guildid = $1 and tagname = $2;"
-    delete = "DELETE FROM tags WHERE guildid = $1 AND tagname = $2;"
-    delete_aliases = "DELETE FROM tag_aliases WHERE guildid = $1 AND tagname = $2;"
-    owner = await ctx.bot.db.fetch_one(select, ctx.guild_id, name)
+    guild_tags = await ctx.bot.tag_index.get(ctx.guild_id)
 
-    if not owner:
+    if not (tag := guild_tags.get(name)):
         # There is no tag with this name.
         await ctx.respond(f"Failed to delete tag `{name}`. It doesn't exist.")
         return None
 
-    if not ctx.author.id == owner:
+    if not ctx.author.id == tag.owner:
         # Fetch the member and permissions.
         member = await ctx.bot.rest.fetch_member(ctx.guild_id, ctx.author.id)
         permissions = lightbulb.utils.permissions_for(member)
 
         if hikari.Permissions.ADMINISTRATOR in permissions:
             # Delete the tag, and announce admin perm usage.
-            await ctx.bot.db.execute(delete_aliases, ctx.guild_id, name)
-            await ctx.bot.db.execute(delete, ctx.guild_id, name)
+            await delete_tag(ctx.bot.db, ctx.guild_id, name)
+            guild_tags.remove(name)
             await ctx.respond(
                 f"<@{member.id}> deleted the `{name}` tag "
-                f"(owned by <@{owner}>) using admin perms."
+                f"(owned by <@{tag.owner}>) using admin perms."
             )
             return None
 
         # They don't own the tag, and are not administrator.
-        await ctx.respond(f"Failed to delete tag `{name}`. <@{owner}> owns it, not you.")
+        await ctx.respond(f"Failed to delete tag `{name}`. <@{tag.owner}> owns it, not you.")
         return None
 
     # Successful deletion by the owner.
-    await ctx.bot.db.execute(delete_aliases, ctx.guild_id, name)
-    await ctx.bot.db.execute(delete, ctx.guild_id, name)
+    await delete_tag(ctx.bot.db, ctx.guild_id, name)
+    guild_tags.remove(name)
     await ctx.respond(f"`{name}` tag deleted by <@{ctx.author.id}>.")
 
 
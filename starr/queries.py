@@ -0,0 +1,148 @@
+# Copyright (c) 2021-present, Jonxslays
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the
+#    distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from __future__ import annotations
+
+# Named queries, prepared once per connection. Pass the name to
+# any of the `Database.fetch_*` or `Database.execute` methods.
+QUERIES: dict[str, str] = {
+    ####################################################################
+    # GUILDS
+    ####################################################################
+    "guild_select": "SELECT * FROM guilds WHERE GuildID = $1;",
+    "guild_select_shards": (
+        "SELECT * FROM guilds WHERE (GuildID >> 22) % $1 = ANY($2::BIGINT[]);"
+    ),
+    "guild_select_slot": "SELECT * FROM guilds WHERE GuildID % $1 = $2;",
+    "guild_prefixes": "SELECT GuildID, Prefix FROM guilds;",
+    "guild_bootstrap": (
+        "WITH inserted AS ("
+        "INSERT INTO guilds (GuildID) SELECT UNNEST($1::BIGINT[]) "
+        "ON CONFLICT DO NOTHING RETURNING *"
+        ") "
+        "SELECT * FROM inserted "
+        "UNION ALL SELECT * FROM guilds WHERE GuildID = ANY($1::BIGINT[]);"
+    ),
+    "guild_set_prefix": "UPDATE guilds SET Prefix = $1 WHERE GuildID = $2;",
+    "guild_set_star_channel": "UPDATE guilds SET StarChannel = $1 WHERE GuildID = $2;",
+    "guild_set_threshold": "UPDATE guilds SET Threshold = $1 WHERE GuildID = $2;",
+    "guild_blacklist_append": (
+        "UPDATE guilds "
+        "SET StarBlacklist = array_append(StarBlacklist, $1) "
+        "WHERE GuildID = $2;"
+    ),
+    "guild_blacklist_set": "UPDATE guilds SET StarBlacklist = $1 WHERE GuildID = $2;",
+    ####################################################################
+    # STARBOARD
+    ####################################################################
+    "starboard_select": ("SELECT StarMessageID FROM starboard_messages WHERE ReferenceID = $1;"),
+    "starboard_select_batch": (
+        # Rows from before ChannelID was stored only turn up by their
+        # reference, this fills the channel in on the way.
+        "WITH found AS ("
+        "SELECT ReferenceID, StarMessageID, ChannelID FROM starboard_messages "
+        "WHERE ReferenceID = ANY($1::BIGINT[])"
+        "), filled AS ("
+        "UPDATE starboard_messages SET ChannelID = $2 WHERE ReferenceID IN ("
+        "SELECT ReferenceID FROM found WHERE ChannelID IS NULL"
+        ")) "
+        "SELECT ReferenceID, StarMessageID FROM found;"
+    ),
+    "starboard_select_range": (
+        "SELECT ReferenceID, StarMessageID FROM starboard_messages "
+        "WHERE ChannelID = $1 AND ReferenceID > $2 AND ReferenceID <= $3;"
+    ),
+    "starboard_insert": (
+        "INSERT INTO starboard_messages (StarMessageID, ReferenceID, ChannelID) "
+        "VALUES ($1, $2, $3) ON CONFLICT DO NOTHING;"
+    ),
+    "starboard_update": (
+        "UPDATE starboard_messages SET StarMessageID = $1 WHERE ReferenceID = $2;"
+    ),
+    "starboard_delete": "DELETE FROM starboard_messages WHERE StarMessageID = $1;",
+    "checkpoint_select": "SELECT MessageID FROM starboard_checkpoints WHERE ChannelID = $1;",
+    "checkpoint_set": (
+        "INSERT INTO starboard_checkpoints (ChannelID, MessageID) VALUES ($1, $2) "
+        "ON CONFLICT (ChannelID) DO UPDATE SET MessageID = EXCLUDED.MessageID;"
+    ),
+    ####################################################################
+    # TAGS
+    ####################################################################
+    "tag_index_load": (
+        "SELECT t.tagname, t.tagowner, t.tagcontent, t.uses, "
+        "array_remove(array_agg(a.tagalias), NULL) "
+        "FROM tags t LEFT JOIN tag_aliases a "
+        "ON t.tagname = a.tagname AND t.guildid = a.guildid "
+        "WHERE t.guildid = $1 "
+        "GROUP BY t.guildid, t.tagname;"
+    ),
+    "tag_uses_flush": (
+        "UPDATE tags SET uses = tags.uses + v.uses "
+        "FROM UNNEST($1::BIGINT[], $2::TEXT[], $3::BIGINT[]) AS v(guildid, tagname, uses) "
+        "WHERE tags.guildid = v.guildid AND tags.tagname = v.tagname;"
+    ),
+    "tag_use": "SELECT * FROM use_tag($1, $2);",
+    # Tag list pages, after or before a tag's (uses, tagname).
+    "tag_list": (
+        "SELECT tagname, tagowner, uses FROM tags WHERE guildid = $1 "
+        "AND uses <= $2 AND (uses < $2 OR tagname > $3) "
+        "ORDER BY uses DESC, tagname LIMIT $4;"
+    ),
+    "tag_list_reverse": (
+        "SELECT tagname, tagowner, uses FROM tags WHERE guildid = $1 "
+        "AND uses >= $2 AND (uses > $2 OR tagname < $3) "
+        "ORDER BY uses, tagname DESC LIMIT $4;"
+    ),
+    "tag_list_by_owner": (
+        "SELECT tagname, tagowner, uses FROM tags "
+        "WHERE guildid = $1 AND tagowner = $2 "
+        "AND uses <= $3 AND (uses < $3 OR tagname > $4) "
+        "ORDER BY uses DESC, tagname LIMIT $5;"
+    ),
+    "tag_list_by_owner_reverse": (
+        "SELECT tagname, tagowner, uses FROM tags "
+        "WHERE guildid = $1 AND tagowner = $2 "
+        "AND uses >= $3 AND (uses > $3 OR tagname < $4) "
+        "ORDER BY uses, tagname DESC LIMIT $5;"
+    ),
+    "tag_count": "SELECT COUNT(*) FROM tags WHERE guildid = $1;",
+    "tag_count_by_owner": "SELECT COUNT(*) FROM tags WHERE guildid = $1 AND tagowner = $2;",
+    "tag_insert": (
+        "INSERT INTO tags (GuildID, TagOwner, TagName, TagContent) VALUES ($1, $2, $3, $4);"
+    ),
+    "tag_set_owner": "UPDATE tags SET tagowner = $1 WHERE guildid = $2 AND tagname = $3;",
+    "tag_set_content": ("UPDATE tags SET tagcontent = $1 WHERE tagname = $2 AND guildid = $3;"),
+    "tag_delete": "DELETE FROM tags WHERE guildid = $1 AND tagname = $2;",
+    "tag_alias_insert": (
+        "INSERT INTO tag_aliases (tagname, tagalias, guildid) VALUES ($1, $2, $3);"
+    ),
+    "tag_aliases_delete": "DELETE FROM tag_aliases WHERE guildid = $1 AND tagname = $2;",
+}
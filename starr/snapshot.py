@@ -0,0 +1,166 @@
+# Copyright (c) 2021-present, Jonxslays
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in the
+#    documentation and/or other materials provided with the
+#    distribution.
+#
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import struct
+import threading
+import typing as t
+from os import environ
+
+from starr.models import StarrGuild
+
+_log = logging.getLogger(__name__)
+
+# The file starts with a magic, format version and guild count. Each
+# guild is then its id, star channel, threshold, prefix length and
+# blacklist length, followed by the prefix and blacklisted channels.
+_MAGIC = b"STRG"
+_VERSION = 1
+_HEADER = struct.Struct("<4sHI")
+_GUILD = struct.Struct("<QQiHH")
+
+
+class GuildSnapshot:
+    """A copy of every guild's configuration on disk, so the bot can
+    answer with the right prefix and starboard settings as soon as it
+    starts, before the database is ready."""
+
+    __slots__ = ("_path", "_interval", "_task", "_lock")
+
+    def __init__(
+        self, path: str | None = None, interval: float = 300, shard: int | None = None
+    ) -> None:
+        self._path = path or environ.get("SNAPSHOT_PATH") or "./starr/data/guilds.snapshot"
+
+        if shard is not None:
+            # Each worker process keeps a snapshot of its own guilds.
+            self._path = f"{self._path}.{shard}"
+        self._interval = interval
+        self._task: asyncio.Task[None] | None = None
+        # A cancelled write keeps going on its thread, so the final
+        # write on close waits its turn.
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def dumps(guilds: t.Iterable[StarrGuild]) -> bytes:
+        body = bytearray()
+        count = 0
+
+        for guild in guilds:
+            prefix = (guild.prefix or "").encode()
+            blacklist = guild.star_blacklist or []
+            body += _GUILD.pack(
+                guild.guild_id,
+                guild.star_channel or 0,
+                guild.threshold,
+                len(prefix),
+                len(blacklist),
+            )
+            body += prefix
+            body += struct.pack(f"<{len(blacklist)}Q", *blacklist)
+            count += 1
+
+        return _HEADER.pack(_MAGIC, _VERSION, count) + body
+
+    @staticmethod
+    def loads(data: bytes) -> dict[int, StarrGuild]:
+        magic, version, count = _HEADER.unpack_from(data)
+
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError("Not a guild snapshot, or an unsupported version.")
+
+        guilds: dict[int, StarrGuild] = {}
+        offset = _HEADER.size
+
+        for _ in range(count):
+            guild_id, star_channel, threshold, prefix_len, blacklist_len = _GUILD.unpack_from(
+                data, offset
+            )
+            offset += _GUILD.size
+            prefix = data[offset : offset + prefix_len].decode()
+            offset += prefix_len
+            blacklist = list(struct.unpack_from(f"<{blacklist_len}Q", data, offset))
+            offset += blacklist_len * 8
+            guilds[guild_id] = StarrGuild(guild_id, prefix, star_channel, threshold, blacklist)
+
+        return guilds
+
+    def load(self) -> dict[int, StarrGuild]:
+        """Load the snapshot, or nothing if there isn't a usable one."""
+        try:
+            with open(self._path, "rb") as f:
+                return self.loads(f.read())
+
+        except FileNotFoundError:
+            return {}
+
+        except (ValueError, struct.error, UnicodeDecodeError):
+            _log.warning("Ignoring unreadable guild snapshot at %s", self._path)
+            return {}
+
+    async def write(self, guilds: t.Iterable[StarrGuild]) -> None:
+        # Packing happens here, so the guilds can't change under us,
+        # only the disk io is done off the event loop.
+        await asyncio.to_thread(self._write, self.dumps(guilds))
+
+    def _write(self, data: bytes) -> None:
+        tmp = f"{self._path}.tmp"
+
+        with self._lock:
+            with open(tmp, "wb") as f:
+                f.write(data)
+
+            # Replace in one step, so a crash never leaves half a
+            # snapshot.
+            os.replace(tmp, self._path)
+
+    def start(self, guilds: dict[int, StarrGuild]) -> None:
+        self._task = asyncio.create_task(self._write_periodically(guilds))
+
+    async def close(self, guilds: dict[int, StarrGuild]) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+        await self.write(guilds.values())
+
+    async def _write_periodically(self, guilds: dict[int, StarrGuild]) -> None:
+        while True:
+            await asyncio.sleep(self._interval)
+
+            try:
+                await self.write(guilds.values())
+            except Exception:
+                _log.exception("Failed to write the guild snapshot")
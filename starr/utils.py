@@ -32,24 +32,110 @@
 from __future__ import annotations
 
 import abc
+import atexit
+import copy
 import datetime
+import json
 import logging
 import math
+import multiprocessing.queues
 import secrets
 import typing as t
+from logging.handlers import QueueHandler
+from logging.handlers import QueueListener
 from logging.handlers import RotatingFileHandler
 from os import environ
+from queue import Full
+from queue import Queue
 
 import hikari
 import lightbulb
 
+from starr import metrics
 from starr.bot import StarrBot
+from starr.db import Database
+
+ListenerT = t.TypeVar("ListenerT", bound=t.Callable[..., t.Coroutine[t.Any, t.Any, None]])
+StatelessSourceT = t.TypeVar(
+    "StatelessSourceT", bound=t.Callable[[StarrBot, hikari.Snowflake, str], "PageSource"]
+)
 
 
 def now() -> datetime.datetime:
     return datetime.datetime.now(datetime.timezone.utc)
 
 
+_formatter = logging.Formatter()
+
+
+class BoundedQueueHandler(QueueHandler):
+    """Hands records to the logging thread, or to the supervisor from a
+    worker, dropping them rather than blocking when it falls too far
+    behind."""
+
+    def __init__(
+        self,
+        queue: Queue[logging.LogRecord] | multiprocessing.queues.Queue[logging.LogRecord],
+    ) -> None:
+        super().__init__(queue)
+        self.dropped = 0
+        self._reported = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Like the default, but the traceback stays out of the message
+        # so the formatter can still place it.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+
+        if record.exc_info:
+            record.exc_text = record.exc_text or _formatter.formatException(record.exc_info)
+            record.exc_info = None
+
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            if self.dropped > self._reported:
+                self.queue.put_nowait(self._dropped_record())
+                self._reported = self.dropped
+
+            self.queue.put_nowait(record)
+
+        except Full:
+            self.dropped += 1
+
+    def _dropped_record(self) -> logging.LogRecord:
+        return logging.LogRecord(
+            __name__,
+            logging.WARNING,
+            __file__,
+            0,
+            f"Dropped {self.dropped - self._reported} log records, the queue was full.",
+            None,
+            None,
+        )
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "process": record.processName,
+            "message": record.getMessage(),
+        }
+
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+
+        if record.exc_text:
+            data["exception"] = record.exc_text
+
+        return json.dumps(data)
+
+
 def configure_logging() -> None:
     log = logging.getLogger("root")
     log.setLevel(logging.INFO)
@@ -61,13 +147,24 @@ def configure_logging() -> None:
         backupCount=10,
     )
 
-    ff = logging.Formatter(
-        f"[%(asctime)s] %(levelname)s ||| %(message)s",
-        datefmt="%Y-%m-%d %H:%M:%S",
-    )
+    ff: logging.Formatter
+    if environ.get("LOG_FORMAT") == "json":
+        ff = JsonFormatter()
+    else:
+        ff = logging.Formatter(
+            f"[%(asctime)s] %(levelname)s ||| %(message)s",
+            datefmt="%Y-%m-%d %H:%M:%S",
+        )
 
     rfh.setFormatter(ff)
-    log.addHandler(rfh)
+
+    # File io and rotation happen on the listener's thread, never on
+    # the event loop.
+    queue: Queue[logging.LogRecord] = Queue(int(environ.get("LOG_QUEUE_SIZE") or 10_000))
+    listener = QueueListener(queue, rfh, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    log.addHandler(BoundedQueueHandler(queue))
 
 
 def get_command_guilds() -> list[int]:
@@ -80,6 +177,37 @@ def get_command_guilds() -> list[int]:
 
 
 class Plugin(lightbulb.Plugin):
+    # Every event any plugin listens for, so each can be counted once.
+    events: t.ClassVar[set[t.Type[hikari.Event]]] = set()
+
+    @t.overload
+    def listener(
+        self, event: t.Type[hikari.Event], listener_func: ListenerT, *, bind: bool = False
+    ) -> ListenerT:
+        ...
+
+    @t.overload
+    def listener(
+        self, event: t.Type[hikari.Event], *, bind: bool = False
+    ) -> t.Callable[[ListenerT], ListenerT]:
+        ...
+
+    def listener(
+        self,
+        event: t.Type[hikari.Event],
+        listener_func: ListenerT | None = None,
+        *,
+        bind: bool = False,
+    ) -> ListenerT | t.Callable[[ListenerT], ListenerT]:
+        # Every listener is timed by the event it is for.
+        def decorate(func: ListenerT) -> ListenerT:
+            Plugin.events.add(event)
+            timed = metrics.timed_listener(event.__name__, func)
+            lightbulb.Plugin.listener(self, event, timed, bind=bind)
+            return func
+
+        return decorate(listener_func) if listener_func else decorate
+
     @property
     def bot(self) -> StarrBot:
         return t.cast(StarrBot, self.app)
@@ -112,18 +240,162 @@ class UserContext(Context, lightbulb.UserContext):
     ...
 
 
+class MemberConverter(lightbulb.converters.MemberConverter):
+    """Falls back to searching the guild over rest, since members
+    are not cached and lightbulb only matches names from the cache."""
+
+    __slots__ = ()
+
+    async def convert(self, arg: str) -> hikari.Member:
+        try:
+            return await super().convert(arg)
+        except (TypeError, ValueError):
+            if self.context.guild_id is None:
+                raise
+
+        name, _, discriminator = arg.partition("#")
+        members = await self.context.app.rest.search_members(self.context.guild_id, name)
+
+        for member in members:
+            if arg in (member.username, member.nickname):
+                return member
+
+            if member.username == name and member.discriminator == discriminator:
+                return member
+
+        raise ValueError("No member could be resolved from the argument")
+
+
+class UserConverter(lightbulb.converters.UserConverter):
+    """Falls back to :obj:`MemberConverter` for names the user cache
+    does not have."""
+
+    __slots__ = ()
+
+    async def convert(self, arg: str) -> hikari.User:
+        try:
+            return await super().convert(arg)
+        except (TypeError, ValueError):
+            return await MemberConverter(self.context).convert(arg)
+
+
+class Parser(lightbulb.utils.Parser):
+    """Prefix command parser that resolves users and members with
+    the converters above."""
+
+    __slots__ = ()
+
+    converters: dict[t.Any, t.Any] = {
+        hikari.Member: MemberConverter,
+        hikari.User: UserConverter,
+    }
+
+    async def _convert(self, value: str, callback_or_type: t.Any) -> t.Any:
+        callback_or_type = self.converters.get(callback_or_type, callback_or_type)
+        return await super()._convert(value, callback_or_type)
+
+
+class PageSource(t.Protocol):
+    """Loads a paginator's fields one page at a time. Pages are found
+    from the fields either side of them, so no page has to skip over
+    the rows before it."""
+
+    async def first(self, limit: int) -> list[tuple[str, ...]]:
+        ...
+
+    async def after(self, field: tuple[str, ...], limit: int) -> list[tuple[str, ...]]:
+        ...
+
+    async def before(self, field: tuple[str, ...], limit: int) -> list[tuple[str, ...]]:
+        ...
+
+    async def last(self, limit: int) -> list[tuple[str, ...]]:
+        ...
+
+
+class QuerySource:
+    """Pages from a pair of keyset queries, which take the values, a
+    cursor's columns and the limit as their arguments.
+
+    `forward` returns the rows after the cursor, and `backward` the
+    rows before it in reverse. `key` turns a field back into its
+    cursor, and `start` and `end` are cursors before the first row and
+    after the last.
+    """
+
+    __slots__ = ("db", "forward", "backward", "values", "format", "key", "start", "end")
+
+    def __init__(
+        self,
+        db: Database,
+        forward: str,
+        backward: str,
+        *values: t.Any,
+        format: t.Callable[[t.Iterable[t.Any]], tuple[str, ...]],
+        key: t.Callable[[tuple[str, ...]], tuple[t.Any, ...]],
+        start: tuple[t.Any, ...],
+        end: tuple[t.Any, ...],
+    ) -> None:
+        self.db = db
+        self.forward = forward
+        self.backward = backward
+        self.values = values
+        self.format = format
+        self.key = key
+        self.start = start
+        self.end = end
+
+    async def _fetch(
+        self, query: str, cursor: tuple[t.Any, ...], limit: int
+    ) -> list[tuple[str, ...]]:
+        rows = await self.db.fetch_rows(query, *self.values, *cursor, limit) or []
+        fields = [self.format(row) for row in rows]
+        return fields[::-1] if query == self.backward else fields
+
+    async def first(self, limit: int) -> list[tuple[str, ...]]:
+        return await self._fetch(self.forward, self.start, limit)
+
+    async def after(self, field: tuple[str, ...], limit: int) -> list[tuple[str, ...]]:
+        return await self._fetch(self.forward, self.key(field), limit)
+
+    async def before(self, field: tuple[str, ...], limit: int) -> list[tuple[str, ...]]:
+        return await self._fetch(self.backward, self.key(field), limit)
+
+    async def last(self, limit: int) -> list[tuple[str, ...]]:
+        return await self._fetch(self.backward, self.end, limit)
+
+
+# Pages for stateless paginators, by the name in their custom ids.
+# Each gets the bot, the guild and the argument the paginator's key
+# was made with.
+STATELESS_SOURCES: dict[str, t.Callable[[StarrBot, hikari.Snowflake, str], PageSource]] = {}
+
+
+def stateless_source(name: str) -> t.Callable[[StatelessSourceT], StatelessSourceT]:
+    """Register a page source for stateless paginators."""
+
+    def decorate(func: StatelessSourceT) -> StatelessSourceT:
+        STATELESS_SOURCES[name] = func
+        return func
+
+    return decorate
+
+
 class Paginator:
 
     __slots__ = (
         "ctx",
+        "key",
         "bot",
         "title",
         "description",
-        "fields",
+        "source",
         "per_page",
+        "total",
         "page",
+        "shown",
         "embed",
-        "converted",
+        "pages",
         "id_hash",
         "message",
         "components",
@@ -131,26 +403,41 @@ class Paginator:
         "inline",
     )
 
+    # Rendered pages this far from the current one are kept.
+    CACHE_AROUND = 2
+    # Starts the custom id of every stateless paginator's buttons.
+    STATELESS = "pag"
+
     def __init__(
         self,
         ctx: Context,
         *,
         title: str,
         description: str,
-        fields: list[tuple[str, ...]],
+        source: PageSource,
+        total: int,
         per_page: int = 5,
         inline: bool = False,
+        key: str | None = None,
     ) -> None:
         self.ctx = ctx
+        # A stateless paginator keeps everything it needs in its
+        # button ids, as `name:arg` for the registered source and
+        # its argument, and `on_interaction` turns its pages.
+        self.key = key
         self.bot = ctx.bot
         self.title = title
         self.description = description
-        self.fields = fields
+        self.source = source
         self.inline = inline
         self.per_page = per_page
+        self.total = total
         self.page = 0
-        self.converted: list[list[tuple[str, ...]]] = []
-        self.num_pages = math.ceil(len(self.fields) / self.per_page)
+        # The page last shown and its fields, the next page is found
+        # from them.
+        self.shown: tuple[int, list[tuple[str, ...]]] = (0, [])
+        self.pages: dict[int, tuple[hikari.Embed, list[tuple[str, ...]]]] = {}
+        self.num_pages = math.ceil(total / self.per_page)
         self.id_hash = secrets.token_urlsafe(8)
         self.message: hikari.Message | None = None
         self.embed = hikari.Embed(
@@ -161,46 +448,113 @@ class Paginator:
         )
 
     def get_next_embed(self, fields: list[tuple[str, ...]]) -> hikari.Embed:
+        return self.render(
+            self.title,
+            self.description,
+            self.ctx.author,
+            self.page,
+            self.num_pages,
+            fields,
+            self.inline,
+        )
+
+    @staticmethod
+    def render(
+        title: str | None,
+        description: str | None,
+        author: hikari.User,
+        page: int,
+        num_pages: int,
+        fields: list[tuple[str, ...]],
+        inline: bool,
+    ) -> hikari.Embed:
         embed = (
             hikari.Embed(
-                title=self.title,
-                description=self.description,
+                title=title,
+                description=description,
                 color=hikari.Color(0x19FA3B),
                 timestamp=datetime.datetime.now(datetime.timezone.utc),
             )
-            .set_thumbnail(self.ctx.author.avatar_url or self.ctx.author.default_avatar_url)
-            .set_footer(f"Page {self.page + 1} of {self.num_pages}")
+            .set_thumbnail(author.avatar_url or author.default_avatar_url)
+            .set_footer(f"Page {page + 1} of {num_pages}")
         )
 
         for field in fields:
-            embed.add_field(field[0], field[1], inline=self.inline)
+            embed.add_field(field[0], field[1], inline=inline)
 
         return embed
 
-    async def paginate(self, timeout: int | float) -> None:
-        current = 0
-        this_list: list[tuple[str, ...]] = []
+    async def get_page(self) -> hikari.Embed:
+        """The embed for the current page, loading it if it isn't one
+        of the cached pages around the last one shown."""
+        if not (cached := self.pages.get(self.page)):
+            page, shown = self.shown
+            fields = await self.turn(
+                self.source, shown, page, self.page, self.per_page, self.total
+            )
+            cached = self.pages[self.page] = (self.get_next_embed(fields), fields)
 
-        for field in self.fields:
-            this_list.append(field)
+        embed, fields = cached
+        self.shown = (self.page, fields)
 
-            if current == self.per_page - 1:
-                self.converted.append(this_list)
-                this_list = []
-                current = 0
-                continue
+        for page in [p for p in self.pages if abs(p - self.page) > self.CACHE_AROUND]:
+            del self.pages[page]
 
-            current += 1
+        return embed
+
+    @staticmethod
+    async def turn(
+        source: PageSource,
+        shown: list[tuple[str, ...]],
+        page: int,
+        target: int,
+        per_page: int,
+        total: int,
+    ) -> list[tuple[str, ...]]:
+        """Load the target page's fields, from the fields shown on the
+        page next to it."""
+        last = math.ceil(total / per_page) - 1
+
+        if target == 0 or not shown:
+            return await source.first(per_page)
+
+        if target >= last:
+            # The last page only holds what is left over.
+            return await source.last(total - last * per_page)
 
-        self.converted.append(this_list)
+        if target == page + 1:
+            return await source.after(shown[-1], per_page)
+
+        if target == page - 1:
+            return await source.before(shown[0], per_page)
+
+        raise ValueError("Pages can only be turned one at a time.")
+
+    async def paginate(self, timeout: int | float) -> None:
         response = await self.ctx.respond(
-            self.get_next_embed(self.converted[self.page]),
+            await self.get_page(),
             components=self.generate_buttons(self.page),
         )
         self.message = await response.message()
-        await self.listen(timeout)
+
+        if not self.key:
+            await self.listen(timeout)
 
     def generate_buttons(self, page: int) -> list[hikari.api.MessageActionRowBuilder]:
+        if self.key:
+            state = self.state_id(self.key, self.ctx.author.id, page, self.total, self.per_page)
+            return self.build_buttons(self.bot.rest, page, self.num_pages, f"{state}:{{}}")
+
+        return self.build_buttons(self.bot.rest, page, self.num_pages, f"{self.id_hash}-{{}}")
+
+    @classmethod
+    def state_id(cls, key: str, owner: int, page: int, total: int, per_page: int) -> str:
+        return f"{cls.STATELESS}:{key}:{owner}:{page}:{total}:{per_page}"
+
+    @staticmethod
+    def build_buttons(
+        rest: hikari.api.RESTClient, page: int, num_pages: int, custom_id: str
+    ) -> list[hikari.api.MessageActionRowBuilder]:
         buttons = {
             "first": "\u23EE\uFE0F",
             "prev": "\u23EA",
@@ -209,25 +563,25 @@ class Paginator:
             "last": "\u23ED\uFE0F",
         }
 
-        row = self.ctx.bot.rest.build_message_action_row()
+        row = rest.build_message_action_row()
 
         for key, button in buttons.items():
             style = hikari.ButtonStyle.PRIMARY if key != "stop" else hikari.ButtonStyle.DANGER
             if (
                 page == 0
                 and key in ("first", "prev")
-                or page >= self.num_pages - 1
+                or page >= num_pages - 1
                 and key in ("last", "next")
             ):
                 (
-                    row.add_button(style, f"{self.id_hash}-{key}")
+                    row.add_button(style, custom_id.format(key))
                     .set_emoji(button)
                     .set_is_disabled(True)
                     .add_to_container()
                 )
             else:
                 (
-                    row.add_button(style, f"{self.id_hash}-{key}")
+                    row.add_button(style, custom_id.format(key))
                     .set_emoji(button)
                     .set_is_disabled(False)
                     .add_to_container()
@@ -241,7 +595,8 @@ class Paginator:
         components: list[hikari.api.MessageActionRowBuilder],
     ) -> None:
         assert self.message is not None
-        embed = self.get_next_embed(self.converted[self.page])
+        embed = await self.get_page()
+        metrics.PAGINATOR_PAGES.inc()
 
         if not interaction:
             await self.message.edit(embed, components=components)
@@ -258,6 +613,14 @@ class Paginator:
             await self.message.edit(embed, components=components)
 
     async def listen(self, timeout: int | float) -> None:
+        metrics.PAGINATORS.inc()
+
+        try:
+            await self._listen(timeout)
+        finally:
+            metrics.PAGINATORS.dec()
+
+    async def _listen(self, timeout: int | float) -> None:
         with self.bot.stream(hikari.InteractionCreateEvent, timeout=timeout).filter(
             lambda e: (
                 isinstance(e.interaction, hikari.ComponentInteraction)
@@ -289,3 +652,65 @@ class Paginator:
                 await self.respond(event.interaction, self.generate_buttons(self.page))
 
         await self.respond(None, [])
+
+    @classmethod
+    async def on_interaction(cls, event: hikari.InteractionCreateEvent) -> None:
+        """Turn the page of any stateless paginator."""
+        interaction = event.interaction
+
+        if not isinstance(interaction, hikari.ComponentInteraction) or (
+            not interaction.custom_id.startswith(f"{cls.STATELESS}:")
+        ):
+            return None
+
+        _, name, arg, owner, page, total, per_page, action = interaction.custom_id.split(":")
+
+        if (
+            interaction.user.id != int(owner)
+            or not interaction.guild_id
+            or name not in STATELESS_SOURCES
+        ):
+            # Only whoever ran the command gets to turn the pages.
+            await interaction.create_initial_response(hikari.ResponseType.DEFERRED_MESSAGE_UPDATE)
+            return None
+
+        if action == "stop":
+            await interaction.create_initial_response(
+                hikari.ResponseType.MESSAGE_UPDATE, components=[]
+            )
+            return None
+
+        num_pages = math.ceil(int(total) / int(per_page))
+        target = {"first": 0, "prev": int(page) - 1, "next": int(page) + 1}.get(
+            action, num_pages - 1
+        )
+        target = max(0, min(target, num_pages - 1))
+
+        # The title, layout and the current page's fields are already
+        # on the message.
+        shown = interaction.message.embeds[0]
+        source = STATELESS_SOURCES[name](t.cast(StarrBot, event.app), interaction.guild_id, arg)
+        fields = await cls.turn(
+            source,
+            [(f.name, f.value) for f in shown.fields],
+            int(page),
+            target,
+            int(per_page),
+            int(total),
+        )
+        metrics.PAGINATOR_PAGES.inc()
+
+        state = cls.state_id(f"{name}:{arg}", int(owner), target, int(total), int(per_page))
+        await interaction.create_initial_response(
+            hikari.ResponseType.MESSAGE_UPDATE,
+            cls.render(
+                shown.title,
+                shown.description,
+                interaction.user,
+                target,
+                num_pages,
+                fields,
+                any(f.is_inline for f in shown.fields),
+            ),
+            components=cls.build_buttons(event.app.rest, target, num_pages, f"{state}:{{}}"),
+        )